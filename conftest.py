@@ -0,0 +1,9 @@
+import pytest
+from django.conf import settings
+from django.test.utils import override_settings
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    """Кэши в памяти вместо общего кэша на диске, как в core.testing."""
+    override_settings(CACHES=settings.TEST_CACHES).enable()
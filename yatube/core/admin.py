@@ -0,0 +1,19 @@
+from django.contrib import admin
+
+from .models import QueuedEmail
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'subject',
+        'status',
+        'attempts',
+        'run_after',
+        'sent')
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipients')
+    exclude = ('message',)
+
+
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
@@ -0,0 +1,67 @@
+"""
+Чтение с реплик базы данных.
+
+Внутри запроса чтения моделей из REPLICATED_APPS уходят на одну из
+реплик DATABASE_REPLICAS, запись — всегда на основную базу. Реплика
+отстаёт, поэтому пользователь, который только что записал, читает
+с основной базы: до конца запроса и, благодаря cookie от
+PrimaryPinMiddleware, ещё PIN_SECONDS секунд, так что его новый пост
+виден сразу после редиректа. Вне запросов (задачи, команды) всё читается
+с основной базы.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICATED_APPS = ('posts', 'auth')
+PIN_COOKIE = 'pin_primary'
+PIN_SECONDS = 10
+
+_state = threading.local()
+
+
+def begin(pinned=False):
+    """Начинает запрос: реплики разрешены, если он не прикреплён."""
+    _state.replicas = not pinned
+    _state.wrote = False
+
+
+def end():
+    """Завершает запрос; возвращает True, если в нём была запись."""
+    wrote = getattr(_state, 'wrote', False)
+    _state.replicas = _state.wrote = False
+    return wrote
+
+
+def pin():
+    """Отправляет чтения до конца запроса на основную базу."""
+    _state.replicas = False
+    _state.wrote = True
+
+
+def read_primary():
+    """Читает до конца запроса с основной базы, не прикрепляя читателя."""
+    _state.replicas = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or not getattr(_state, 'replicas', False)
+                or model._meta.app_label not in REPLICATED_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in REPLICATED_APPS:
+            pin()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
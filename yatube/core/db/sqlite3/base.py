@@ -0,0 +1,48 @@
+"""
+Бэкенд SQLite для работы под нагрузкой.
+
+Каждое новое соединение получает прагмы PRAGMAS (журнал WAL, ожидание
+блокировки вместо мгновенной ошибки, кэш страниц и отображение файла
+в память); их можно переопределить в OPTIONS['pragmas']. Транзакции
+начинаются с BEGIN IMMEDIATE: отложенная транзакция, которая сначала
+читает, а потом пишет, в WAL получает «database is locked» сразу, без
+ожидания busy_timeout. is_usable действительно проверяет соединение,
+чтобы постоянные соединения (CONN_MAX_AGE) после ошибки не переиспользовались
+сломанными.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODE = 'IMMEDIATE'
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.transaction_mode = params.pop('transaction_mode',
+                                           TRANSACTION_MODE)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def is_usable(self):
+        try:
+            self.connection.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,181 @@
+"""
+Отложенная отправка почты.
+
+QueuedEmailBackend только сохраняет письма в таблицу и ставит их доставку
+в очередь задач tasks, так что запрос, отправивший письмо (например,
+сброс пароля), не ждёт почтовый сервер. Доставка забирает письма пачками
+и отправляет каждую пачку через одно соединение бэкенда
+EMAIL_DELIVERY_BACKEND; неудачное письмо повторяется с экспоненциальной
+задержкой. Попытку тратит и истёкшая аренда: письмо, на котором
+обработчик зависает или падает, после MAX_ATTEMPTS помечается неудачным.
+"""
+import json
+import traceback
+import uuid
+from datetime import timedelta
+from email import message_from_bytes
+from email.message import Message
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.message import MIMEMixin
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DatabaseError
+from django.db.models import Case, F, Min, Q, When
+from django.utils import timezone
+
+from tasks.models import Task
+from tasks.queue import backoff, enqueue, task_name
+
+from .models import QueuedEmail
+
+BATCH_SIZE = 50
+LEASE = 5 * 60
+MAX_ATTEMPTS = 5
+
+
+class StoredMIME(MIMEMixin, Message):
+    """Разобранное письмо с as_bytes(linesep=...), как ждут бэкенды Django."""
+
+
+class StoredMessage(EmailMessage):
+    """Сохранённое письмо: любой бэкенд отправит его байт в байт."""
+
+    def __init__(self, email):
+        super().__init__(subject=email.subject, from_email=email.from_email,
+                         to=json.loads(email.recipients))
+        self.raw = bytes(email.message)
+
+    def message(self):
+        return message_from_bytes(self.raw, _class=StoredMIME)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Почтовый бэкенд, который только ставит письма в очередь."""
+
+    def send_messages(self, email_messages):
+        emails = [
+            QueuedEmail(subject=message.subject[:255],
+                        from_email=message.from_email,
+                        recipients=json.dumps(message.recipients()),
+                        message=message.message().as_bytes())
+            for message in email_messages if message.recipients()
+        ]
+        if not emails:
+            return 0
+        try:
+            QueuedEmail.objects.bulk_create(emails)
+            enqueue(deliver)
+        except DatabaseError:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(emails)
+
+
+def due(now):
+    """Письма, которые можно забрать: ждущие и с истёкшей арендой."""
+    return QueuedEmail.objects.filter(
+        Q(status=QueuedEmail.QUEUED, run_after__lte=now)
+        | Q(status=QueuedEmail.SENDING, locked_until__lt=now,
+            attempts__lt=MAX_ATTEMPTS - 1)
+    )
+
+
+def expire(now):
+    """Помечает неудачными письма, истратившие попытки на аренды."""
+    return QueuedEmail.objects.filter(
+        status=QueuedEmail.SENDING, locked_until__lt=now,
+        attempts__gte=MAX_ATTEMPTS - 1,
+    ).update(status=QueuedEmail.FAILED, attempts=F('attempts') + 1,
+             locked_until=None,
+             last_error='Аренда истекла после последней попытки')
+
+
+def claim(batch_size=BATCH_SIZE):
+    """
+    Забирает в аренду пачку писем одним условным UPDATE.
+
+    Письмо с истёкшей арендой забирается снова с зачтённой попыткой.
+    """
+    now = timezone.now()
+    expire(now)
+    token = uuid.uuid4().hex
+    ids = list(due(now).values_list('pk', flat=True)[:batch_size])
+    due(now).filter(pk__in=ids).update(
+        status=QueuedEmail.SENDING, locked_by=token,
+        locked_until=now + timedelta(seconds=LEASE),
+        attempts=Case(When(status=QueuedEmail.SENDING,
+                           then=F('attempts') + 1),
+                      default=F('attempts')),
+    )
+    return list(QueuedEmail.objects.filter(locked_by=token,
+                                           status=QueuedEmail.SENDING))
+
+
+def postpone(emails, error):
+    """
+    Откладывает пачку после ошибки на первом её письме.
+
+    Ошибка обычно значит, что недоступен сервер, поэтому остальные письма
+    ждут столько же, но попытку не тратят.
+    """
+    failed = emails[0]
+    mine = QueuedEmail.objects.filter(locked_by=failed.locked_by,
+                                      status=QueuedEmail.SENDING)
+    attempts = failed.attempts + 1
+    run_after = timezone.now() + timedelta(seconds=backoff(attempts))
+    mine.filter(pk=failed.pk).update(
+        status=(QueuedEmail.QUEUED if attempts < MAX_ATTEMPTS
+                else QueuedEmail.FAILED),
+        attempts=attempts, last_error=error, run_after=run_after,
+        locked_until=None,
+    )
+    mine.update(status=QueuedEmail.QUEUED, run_after=run_after,
+                locked_until=None)
+
+
+def send_batch(emails):
+    """Отправляет пачку через одно соединение; возвращает число писем."""
+    connection = get_connection(settings.EMAIL_DELIVERY_BACKEND)
+    sent = 0
+    try:
+        with connection:
+            for email in emails:
+                connection.send_messages([StoredMessage(email)])
+                QueuedEmail.objects.filter(pk=email.pk).update(
+                    status=QueuedEmail.SENT, sent=timezone.now(),
+                    locked_until=None)
+                sent += 1
+    except Exception:
+        if sent < len(emails):
+            postpone(emails[sent:], traceback.format_exc())
+    return sent
+
+
+def reschedule():
+    """Ставит следующую доставку к ближайшему отложенному письму."""
+    if Task.objects.filter(name=task_name(deliver),
+                           status=Task.QUEUED).exists():
+        return
+    next_at = QueuedEmail.objects.filter(
+        status=QueuedEmail.QUEUED).aggregate(
+        next_at=Min('run_after'))['next_at']
+    if next_at is not None:
+        delay = (next_at - timezone.now()).total_seconds()
+        enqueue(deliver, delay=max(delay, 0))
+
+
+def deliver(batch_size=BATCH_SIZE):
+    """Отправляет готовые письма пачками; возвращает число отправленных."""
+    total = 0
+    while True:
+        emails = claim(batch_size)
+        if not emails:
+            break
+        sent = send_batch(emails)
+        total += sent
+        if sent < len(emails):
+            break
+    reschedule()
+    return total
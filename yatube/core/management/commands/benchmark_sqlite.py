@@ -0,0 +1,133 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+# Как закрываются соединения, задаёт CONN_MAX_AGE: 0 — после каждой
+# операции, как после запроса без постоянных соединений.
+CONFIGS = {
+    'django': {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0},
+    'core': {'ENGINE': 'core.db.sqlite3', 'CONN_MAX_AGE': None},
+}
+AUTHORS = 100
+
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = self.writes = self.errors = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+
+def read(connection, rng):
+    # Чтения в представлениях идут вне транзакции.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT id, text FROM bench WHERE author = %s '
+            'ORDER BY id DESC LIMIT 10', [rng.randrange(AUTHORS)])
+        cursor.fetchall()
+
+
+def write(connection, rng):
+    # Сначала чтение, потом запись — как при создании поста со счётчиками.
+    author = rng.randrange(AUTHORS)
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM bench WHERE author = %s',
+                           [author])
+            cursor.fetchone()
+            cursor.execute('INSERT INTO bench (author, text) VALUES (%s, %s)',
+                           [author, 'x' * 200])
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения и записи при параллельной '
+        'нагрузке на стандартном бэкенде SQLite и на core.db.sqlite3'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--config', action='append', dest='configs',
+                            choices=sorted(CONFIGS),
+                            help='Конфигурация; можно указать несколько раз')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"бэкенд":<10}{"чтений/с":>12}{"записей/с":>12}{"ошибок":>9}')
+        for name in options['configs'] or CONFIGS:
+            with tempfile.TemporaryDirectory() as directory:
+                counter = self.run(name, os.path.join(directory, 'bench.db'),
+                                   options)
+            duration = options['duration']
+            self.stdout.write(
+                f'{name:<10}{counter.reads / duration:>12.0f}'
+                f'{counter.writes / duration:>12.0f}{counter.errors:>9}')
+
+    def run(self, name, path, options):
+        alias = f'benchmark_{name}'
+        connections.databases[alias] = {**CONFIGS[name], 'NAME': path}
+        try:
+            self.fill(alias, options['rows'])
+            counter = Counter()
+            deadline = time.monotonic() + options['duration']
+            threads = [
+                threading.Thread(target=self.work,
+                                 args=(alias, operation, counter, deadline, i))
+                for i, operation in enumerate(
+                    [read] * options['readers'] + [write] * options['writers'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        return counter
+
+    def fill(self, alias, rows):
+        rng = random.Random(0)
+        with transaction.atomic(using=alias):
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    'CREATE TABLE bench (id INTEGER PRIMARY KEY, '
+                    'author INTEGER NOT NULL, text TEXT NOT NULL)')
+                cursor.execute('CREATE INDEX bench_author ON bench (author)')
+                cursor.executemany(
+                    'INSERT INTO bench (author, text) VALUES (%s, %s)',
+                    [(rng.randrange(AUTHORS), 'x' * 200)
+                     for _ in range(rows)])
+        connections[alias].close()
+
+    def work(self, alias, operation, counter, deadline, seed):
+        rng = random.Random(seed)
+        connection = connections[alias]
+        reads = writes = errors = 0
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    operation(connection, rng)
+                except OperationalError:
+                    errors += 1
+                else:
+                    if operation is read:
+                        reads += 1
+                    else:
+                        writes += 1
+                connection.close_if_unusable_or_obsolete()
+        finally:
+            connection.close()
+        counter.add(reads=reads, writes=writes, errors=errors)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import mail
+from core.models import QueuedEmail
+
+
+class Command(BaseCommand):
+    help = (
+        'Отправляет письма из очереди пачками через EMAIL_DELIVERY_BACKEND '
+        'и показывает, сколько писем в каждом статусе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=mail.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        sent = mail.deliver(options['batch_size'])
+        self.stdout.write(f'Отправлено писем: {sent}')
+        for status, title in QueuedEmail.STATUSES:
+            count = QueuedEmail.objects.filter(status=status).count()
+            self.stdout.write(f'{title:<18}{count:>8}')
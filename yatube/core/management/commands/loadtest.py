@@ -0,0 +1,299 @@
+import json
+import math
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler)
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from posts.models import Follow, Group, Post, User
+
+SCENARIOS = ('anonymous', 'follow', 'post', 'comment')
+DEFAULT_MIX = 'anonymous=6,follow=2,post=1,comment=1'
+PERCENTILES = (50, 95, 99)
+SAMPLE_SIZE = 200
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга; values отсортирован."""
+    if not values:
+        return None
+    index = max(math.ceil(rank / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f'Неизвестный сценарий {name!r}')
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f'Вес сценария {name!r} должен быть числом')
+        if not math.isfinite(weights[name]) or weights[name] < 0:
+            raise CommandError(
+                f'Вес сценария {name!r} должен быть неотрицательным')
+    if not any(weights.values()):
+        raise CommandError('Хотя бы один сценарий должен иметь вес больше 0')
+    return weights
+
+
+def view_name(url):
+    try:
+        return resolve(urlparse(url).path).view_name
+    except Resolver404:
+        return 'unresolved'
+
+
+class Recorder:
+    """Потокобезопасный сбор задержек по именам представлений."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.recording = False
+
+    def add(self, name, seconds, ok):
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies[name].append(seconds * 1000)
+            if not ok:
+                self.errors[name] += 1
+
+
+class Client:
+    """Виртуальный пользователь, выполняющий сценарии по очереди."""
+
+    def __init__(self, base_url, recorder, sample, rng, user=None):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.sample = sample
+        self.rng = rng
+        self.session = requests.Session()
+        self.user = user
+        if user is not None:
+            self.session.cookies.set(settings.SESSION_COOKIE_NAME,
+                                     login_session(user))
+
+    def request(self, method, path, **kwargs):
+        url = self.base_url + path
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url,
+                                            allow_redirects=False, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        name = view_name(path)
+        if method != 'GET':
+            name = f'{name} {method}'
+        self.recorder.add(name, time.perf_counter() - started, ok)
+        return response
+
+    def csrf_token(self, path):
+        self.request('GET', path)
+        return self.session.cookies.get(settings.CSRF_COOKIE_NAME, '')
+
+    def anonymous(self):
+        choice = self.rng.choice
+        self.request('GET', reverse('posts:index'))
+        self.request('GET', reverse('posts:index')
+                     + f'?page={self.rng.randint(2, 50)}')
+        if self.sample['groups']:
+            self.request('GET', reverse('posts:group_list',
+                                        args=[choice(self.sample['groups'])]))
+        self.request('GET', reverse('posts:profile',
+                                    args=[choice(self.sample['authors'])]))
+        self.request('GET', reverse('posts:post_detail',
+                                    args=[choice(self.sample['posts'])]))
+
+    def follow(self):
+        self.request('GET', reverse('posts:follow_index'))
+
+    def post(self):
+        token = self.csrf_token(reverse('posts:post_create'))
+        self.request('POST', reverse('posts:post_create'), data={
+            'csrfmiddlewaretoken': token,
+            'text': f'Нагрузочный пост {self.rng.random()}',
+        })
+
+    def comment(self):
+        post_id = self.rng.choice(self.sample['posts'])
+        token = self.csrf_token(reverse('posts:post_detail', args=[post_id]))
+        self.request('POST', reverse('posts:add_comment', args=[post_id]),
+                     data={'csrfmiddlewaretoken': token,
+                           'text': 'Нагрузочный комментарий'})
+
+    def run(self, weights, deadline):
+        names = list(weights)
+        if self.user is None:
+            names = ['anonymous']
+        cum_weights = None if self.user is None else [
+            sum(weights[name] for name in names[:i + 1])
+            for i in range(len(names))
+        ]
+        while time.monotonic() < deadline:
+            scenario = self.rng.choices(names, cum_weights=cum_weights)[0]
+            getattr(self, scenario)()
+
+
+def login_session(user):
+    """Создаёт сессию пользователя так же, как Client.force_login."""
+    session = SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return session.session_key
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает WSGI-приложение в процессе и нагружает его виртуальными '
+        'пользователями; печатает RPS и перцентили задержек по '
+        'представлениям и сохраняет результат в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--logged-in', type=float, default=0.5,
+                            help='Доля авторизованных клиентов')
+        parser.add_argument('--duration', type=float, default=30.0)
+        parser.add_argument('--warmup', type=float, default=3.0)
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Веса сценариев: ' + DEFAULT_MIX)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='loadtest.json')
+
+    def sample(self):
+        sample = {
+            'groups': list(Group.objects.values_list('slug', flat=True)
+                           .order_by('?')[:SAMPLE_SIZE]),
+            'authors': list(User.objects.filter(posts__isnull=False)
+                            .values_list('username', flat=True)
+                            .distinct()[:SAMPLE_SIZE]),
+            'posts': list(Post.objects.values_list('pk', flat=True)
+                          [:SAMPLE_SIZE]),
+        }
+        if not sample['posts']:
+            raise CommandError(
+                'В базе нет постов: заполните её командой generate_data'
+            )
+        return sample
+
+    def readers(self, count):
+        users = list(User.objects.filter(
+            pk__in=Follow.objects.values('user_id')
+        )[:count])
+        return users or list(User.objects.all()[:count])
+
+    def handle(self, *args, **options):
+        from yatube.wsgi import application
+
+        weights = parse_mix(options['mix'])
+        rng = random.Random(options['seed'])
+        sample = self.sample()
+        logged_in = round(options['clients'] * options['logged_in'])
+        readers = self.readers(logged_in)
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(application)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+        recorder = Recorder()
+        clients = [
+            Client(base_url, recorder, sample,
+                   random.Random(rng.random()),
+                   readers[i % len(readers)]
+                   if i < logged_in and readers else None)
+            for i in range(options['clients'])
+        ]
+        deadline = (time.monotonic() + options['warmup']
+                    + options['duration'])
+        threads = [threading.Thread(target=client.run,
+                                    args=(weights, deadline))
+                   for client in clients]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['warmup'])
+        recorder.recording = True
+        started = time.monotonic()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        server.shutdown()
+        server.server_close()
+
+        report = self.report(recorder, elapsed, options)
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результат сохранён в {options["output"]}')
+
+    def report(self, recorder, elapsed, options):
+        views = {}
+        self.stdout.write(
+            f'{"представление":<32}{"запросов":>9}{"rps":>9}'
+            f'{"p50":>9}{"p95":>9}{"p99":>9}{"ошибок":>8}'
+        )
+        for name in sorted(recorder.latencies):
+            latencies = sorted(recorder.latencies[name])
+            stats = {
+                'requests': len(latencies),
+                'rps': len(latencies) / elapsed,
+                'errors': recorder.errors[name],
+            }
+            for rank in PERCENTILES:
+                stats[f'p{rank}_ms'] = percentile(latencies, rank)
+            views[name] = stats
+            self.stdout.write(
+                f'{name:<32}{stats["requests"]:>9}{stats["rps"]:>9.1f}'
+                f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}'
+                f'{stats["p99_ms"]:>9.1f}{stats["errors"]:>8}'
+            )
+        total = sum(stats['requests'] for stats in views.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {total} запросов за {elapsed:.1f} с: '
+            f'{total / elapsed:.1f} rps'
+        ))
+        return {
+            'commit': git_commit(),
+            'started_at': timezone.now().isoformat(),
+            'options': {key: options[key] for key in (
+                'clients', 'logged_in', 'duration', 'warmup', 'mix', 'seed')},
+            'elapsed': elapsed,
+            'requests': total,
+            'rps': total / elapsed,
+            'views': views,
+        }
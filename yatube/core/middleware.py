@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from core import pagecache
+from core.db import routers
+
+
+class PrimaryPinMiddleware:
+    """
+    Прикрепляет к основной базе запросы пользователя, который недавно
+    что-то записал, чтобы он не читал с отстающей реплики.
+
+    Страницы для общего кэша анонимных читателей читаются с основной
+    базы отдельно, в pagecache.tag_page.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.begin(pinned=routers.PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end()
+        if wrote:
+            response.set_cookie(routers.PIN_COOKIE, '1',
+                                max_age=routers.PIN_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Отдаёт анонимным читателям страницы из pagecache.
+
+    Анонимным считается запрос без cookie сессии, поэтому попадание
+    в кэш не стоит ни одного запроса к базе. Стоит снаружи сессий и CSRF,
+    чтобы видеть все cookie ответа: ответ с cookie не кэшируется.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.page_cacheable = (
+            request.method == 'GET'
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        )
+        request.page_tags = {}
+        if not request.page_cacheable:
+            return self.get_response(request)
+        response = pagecache.cached_page(request)
+        if response is not None:
+            return get_conditional_response(
+                request, etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(
+                    response.get('Last-Modified', '')),
+                response=response,
+            )
+        response = self.get_response(request)
+        if request.page_tags:
+            patch_vary_headers(response, ('Cookie',))
+            pagecache.store_page(request, response)
+        return response
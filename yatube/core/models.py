@@ -0,0 +1,40 @@
+from django.db import models
+from django.utils import timezone
+
+
+class QueuedEmail(models.Model):
+    """Письмо, принятое почтовым бэкендом и ждущее отправки."""
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не отправлено'),
+    )
+
+    subject = models.CharField('Тема', max_length=255, blank=True)
+    from_email = models.CharField('Отправитель', max_length=255)
+    recipients = models.TextField('Получатели')
+    message = models.BinaryField('Сообщение MIME')
+    status = models.CharField('Статус', max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    run_after = models.DateTimeField('Отправить после', default=timezone.now)
+    locked_by = models.CharField('Обработчик', max_length=100, blank=True)
+    locked_until = models.DateTimeField('Аренда до', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создано', auto_now_add=True)
+    sent = models.DateTimeField('Отправлено', null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='email_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} [{self.get_status_display()}]'
@@ -0,0 +1,89 @@
+"""
+Кэш страниц целиком для анонимных читателей.
+
+Представление помечает страницу тегами (tag_page): лента, группа,
+автор, пост. Вместе с ответом сохраняются версии этих тегов на момент,
+когда представление начало читать данные. Изменение данных сдвигает
+версии только своих тегов (purge), и страница с устаревшей версией
+просто перестаёт отдаваться из кэша. Все страницы дополнительно
+помечены тегом ALL_TAG для изменений, задевающих всё сразу.
+
+Версия тега — время его последнего изменения в миллисекундах, поэтому
+по версиям страницы можно отдать и её Last-Modified.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache, caches
+
+from core.db import routers
+
+TAG_KEY = 'pages:tag:{}'
+PAGE_KEY = 'pages:page:{}'
+ALL_TAG = 'all'
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; недостающие создаются."""
+    keys = {TAG_KEY.format(tag): tag for tag in tags}
+    versions = caches['versions'].get_many(keys)
+    missing = {key: now() for key in keys if key not in versions}
+    if missing:
+        caches['versions'].set_many(missing, None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def now():
+    return int(time.time() * 1000)
+
+
+def purge(*tags):
+    """Сдвигает версии тегов: помеченные ими страницы устаревают."""
+    versions = caches['versions']
+    keys = [TAG_KEY.format(tag) for tag in tags]
+    current = versions.get_many(keys)
+    versions.set_many({key: max(current.get(key, 0) + 1, now())
+                       for key in keys}, None)
+
+
+def tag_page(request, *tags):
+    """
+    Помечает страницу тегами; вызывается до чтения её данных.
+
+    Данные помеченной страницы читаются с основной базы: отставание
+    реплики иначе застыло бы в кэше до следующего изменения. Теги,
+    известные только после чтения, добавляются повторным вызовом.
+    Для запросов, которые не кэшируются, ничего не делает.
+    """
+    if not getattr(request, 'page_cacheable', False):
+        return
+    routers.read_primary()
+    new = {ALL_TAG, *tags} - set(request.page_tags)
+    request.page_tags.update(tag_versions(new))
+
+
+def page_key(request):
+    uri = request.build_absolute_uri()
+    return PAGE_KEY.format(hashlib.md5(uri.encode()).hexdigest())
+
+
+def cached_page(request):
+    """Ответ из кэша, если версии всех его тегов не изменились."""
+    entry = cache.get(page_key(request))
+    if entry is None:
+        return None
+    versions, response = entry
+    if tag_versions(versions) != versions:
+        return None
+    return response
+
+
+def store_page(request, response):
+    """Сохраняет ответ, если он одинаков для всех анонимных читателей."""
+    if (not request.page_tags or response.status_code != 200
+            or response.streaming or response.cookies):
+        return
+    cache.set(page_key(request), (request.page_tags, response),
+              PAGE_CACHE_TIMEOUT)
@@ -0,0 +1,43 @@
+import hashlib
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# Только «хеш.расширение»: суффиксы вроде -1280w или _AbCdEf1 значат, что
+# имя выдано не по содержимому и байты под ним могут смениться.
+CONTENT_HASH = re.compile(r'(^|/)[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def is_content_addressed(name):
+    """Назван ли файл по хешу содержимого, то есть неизменен ли он."""
+    return bool(CONTENT_HASH.search(name))
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    Хранилище, которое называет файлы по SHA-256 содержимого.
+
+    Одинаковые загрузки хранятся один раз, а содержимое файла по одному
+    и тому же URL никогда не меняется, так что его можно кэшировать вечно.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, basename = posixpath.split(name)
+        extension = posixpath.splitext(basename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
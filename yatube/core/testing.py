@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с кэшами TEST_CACHES вместо общего кэша на диске."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_caches = override_settings(CACHES=settings.TEST_CACHES)
+        self.test_caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_caches.disable()
+        super().teardown_test_environment(**kwargs)
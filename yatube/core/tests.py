@@ -1,5 +1,45 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import timedelta
 from http import HTTPStatus
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.mail import EmailMessage, send_mass_mail
+from django.core.mail.backends import smtp
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Follow, Group, Post
+from tasks.models import Task
+from tasks.queue import run_pending
+
+from . import pagecache
+from .db import routers
+from .db.sqlite3.base import DatabaseWrapper
+from .mail import MAX_ATTEMPTS, StoredMessage, claim, deliver
+from .middleware import AnonymousPageCacheMiddleware
+from .models import QueuedEmail
+from .storage import ContentHashStorage, is_content_addressed
+from .views import media
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -7,3 +47,383 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class LoadTestCommandTest(TransactionTestCase):
+    def setUp(self):
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=author)
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        for i in range(3):
+            Post.objects.create(text=f'Пост {i}', author=author, group=group)
+
+    def test_loadtest_writes_report(self):
+        """Команда loadtest сохраняет перцентили по представлениям."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command('loadtest', clients=2, duration=1, warmup=0,
+                         mix='anonymous=1,follow=1', output=output,
+                         stdout=StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+        self.assertGreater(report['requests'], 0)
+        index = report['views']['posts:index']
+        self.assertEqual(index['errors'], 0)
+        self.assertLessEqual(index['p50_ms'], index['p99_ms'])
+
+    def test_loadtest_rejects_bad_mix(self):
+        """Неверная смесь сценариев отвергается до запуска нагрузки."""
+        for mix in ('follow=x', 'follow=-1', 'follow=inf', 'follow=0'):
+            with self.subTest(mix=mix):
+                with self.assertRaises(CommandError):
+                    call_command('loadtest', mix=mix, stdout=StringIO())
+
+
+class ContentHashStorageTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.storage = ContentHashStorage(self.root)
+
+    def test_identical_uploads_stored_once(self):
+        """Одинаковое содержимое сохраняется один раз под именем-хешем"""
+        first = self.storage.save('posts/a.GIF', ContentFile(b'gif'))
+        second = self.storage.save('posts/b.gif', ContentFile(b'gif'))
+        self.assertEqual(first, second)
+        self.assertEqual(first,
+                         f'posts/{hashlib.sha256(b"gif").hexdigest()}.gif')
+        self.assertEqual(os.listdir(os.path.join(self.root, 'posts')),
+                         [os.path.basename(first)])
+        self.assertNotEqual(
+            self.storage.save('posts/c.gif', ContentFile(b'png')), first)
+
+    def test_media_view_marks_hashed_files_immutable(self):
+        """Файлы с именем-хешем отдаются с вечным кэшированием"""
+        hashed = self.storage.save('posts/a.gif', ContentFile(b'gif'))
+        FileSystemStorage(self.root).save('posts/plain.gif',
+                                          ContentFile(b'gif'))
+        request = RequestFactory().get('/media/')
+        response = media(request, hashed, document_root=self.root)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertTrue(response.has_header('Expires'))
+        response = media(request, 'posts/plain.gif', document_root=self.root)
+        self.assertFalse(response.has_header('Cache-Control'))
+
+    def test_only_bare_hash_names_are_content_addressed(self):
+        """Имя с суффиксом после хеша не считается неизменным"""
+        digest = hashlib.sha256(b'gif').hexdigest()
+        for name, expected in ((f'posts/{digest}.gif', True),
+                               (digest, True),
+                               (f'posts/{digest}-1280w.webp', False),
+                               (f'posts/{digest}_AbCdEf1.gif', False),
+                               (f'posts/{digest}.GIF', False)):
+            with self.subTest(name=name):
+                self.assertIs(is_content_addressed(name), expected)
+
+
+class CountingBackend(EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+
+
+class FailingBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('SMTP недоступен')
+
+
+@override_settings(
+    EMAIL_BACKEND='core.mail.QueuedEmailBackend',
+    EMAIL_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class QueuedEmailTest(TestCase):
+    def test_password_reset_only_enqueues(self):
+        """Сброс пароля ставит письмо в очередь, а отправляет обработчик"""
+        User.objects.create_user(username='user', email='user@example.com',
+                                 password='password')
+        response = self.client.post(reverse('users:password_reset'),
+                                    {'email': 'user@example.com'})
+        self.assertRedirects(response, reverse('users:password_reset_done'))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(QueuedEmail.objects.get().status, QueuedEmail.QUEUED)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        self.assertIn('user@example.com', mail.outbox[0].message()['To'])
+        self.assertEqual(QueuedEmail.objects.get().status, QueuedEmail.SENT)
+
+    @override_settings(EMAIL_DELIVERY_BACKEND='core.tests.CountingBackend')
+    def test_batch_shares_connection(self):
+        """Пачка писем отправляется через одно соединение"""
+        CountingBackend.opened = 0
+        send_mass_mail([(f'Письмо {i}', 'Текст', 'from@example.com',
+                         [f'to{i}@example.com']) for i in range(5)])
+        self.assertEqual(deliver(batch_size=10), 5)
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual([message.subject for message in mail.outbox],
+                         [f'Письмо {i}' for i in range(5)])
+
+    @override_settings(EMAIL_DELIVERY_BACKEND='core.tests.FailingBackend')
+    def test_failure_backs_off_whole_batch(self):
+        """После ошибки пачка откладывается, попытку тратит одно письмо"""
+        send_mass_mail([('Письмо', 'Текст', 'from@example.com',
+                         [f'to{i}@example.com']) for i in range(3)])
+        Task.objects.all().delete()
+        self.assertEqual(deliver(), 0)
+        first, *rest = QueuedEmail.objects.order_by('pk')
+        self.assertEqual(first.attempts, 1)
+        self.assertIn('SMTP недоступен', first.last_error)
+        self.assertEqual({email.attempts for email in rest}, {0})
+        for email in [first] + rest:
+            self.assertEqual(email.status, QueuedEmail.QUEUED)
+            self.assertGreater(email.run_after, timezone.now())
+        retry = Task.objects.get(status=Task.QUEUED)
+        self.assertGreaterEqual(retry.run_after, first.run_after)
+
+    def test_expired_lease_spends_attempts(self):
+        """Письмо, чья аренда истекала на каждой попытке, не повторяется"""
+        EmailMessage('Тема', 'Текст', 'from@example.com',
+                     ['to@example.com']).send()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            [email] = claim()
+            self.assertEqual(email.attempts, attempt - 1)
+            QueuedEmail.objects.update(
+                locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim(), [])
+        email = QueuedEmail.objects.get()
+        self.assertEqual(email.status, QueuedEmail.FAILED)
+        self.assertEqual(email.attempts, MAX_ATTEMPTS)
+
+    def test_file_backend_receives_original_bytes(self):
+        """Файловый бэкенд получает письмо без искажений"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        EmailMessage('Тема', 'Привет, мир', 'from@example.com',
+                     ['to@example.com']).send()
+        with self.settings(
+            EMAIL_DELIVERY_BACKEND=(
+                'django.core.mail.backends.filebased.EmailBackend'),
+            EMAIL_FILE_PATH=directory.name,
+        ):
+            deliver()
+        [name] = os.listdir(directory.name)
+        with open(os.path.join(directory.name, name), 'rb') as file:
+            content = file.read()
+        self.assertIn(bytes(QueuedEmail.objects.get().message), content)
+
+    def test_smtp_backend_sends_stored_message(self):
+        """SMTP-бэкенд отправляет сохранённое письмо со строками CRLF"""
+        EmailMessage('Тема', 'Привет, мир', 'from@example.com',
+                     ['to@example.com']).send()
+        backend = smtp.EmailBackend()
+        backend.connection = mock.Mock()
+        self.assertTrue(
+            backend._send(StoredMessage(QueuedEmail.objects.get())))
+        (from_email, recipients, raw), _ = (
+            backend.connection.sendmail.call_args)
+        self.assertEqual(from_email, 'from@example.com')
+        self.assertEqual(recipients, ['to@example.com'])
+        self.assertEqual(
+            raw, bytes(QueuedEmail.objects.get().message).replace(
+                b'\n', b'\r\n'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.addCleanup(routers.end)
+
+    def test_reads_go_to_replicas_inside_request(self):
+        """В запросе чтения постов идут на реплики, запись — на основную"""
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        routers.begin()
+        self.assertIn(self.router.db_for_read(Post), ['replica1', 'replica2'])
+        self.assertIn(self.router.db_for_read(User), ['replica1', 'replica2'])
+        self.assertEqual(self.router.db_for_read(Task), 'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_write_pins_request_to_primary(self):
+        """После записи чтения до конца запроса идут на основную базу"""
+        routers.begin()
+        self.router.db_for_write(Task)
+        self.assertNotEqual(self.router.db_for_read(Post), 'default')
+        self.router.db_for_write(Post)
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertTrue(routers.end())
+        routers.begin(pinned=True)
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertFalse(routers.end())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """Без реплик всё читается с основной базы"""
+        routers.begin()
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaIntegrationTest(TransactionTestCase):
+    """Реплику изображает второй файл SQLite, отстающий от основной базы."""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(cls.directory)
+
+    def replicate(self):
+        """Копирует основную базу в реплику, как это сделала бы репликация."""
+        connections['replica'].close()
+        primary = connections['default']
+        primary.ensure_connection()
+        target = sqlite3.connect(connections.databases['replica']['NAME'])
+        with target:
+            primary.connection.backup(target)
+        target.close()
+
+    def test_writer_reads_own_post_others_read_replica(self):
+        """Автор сразу видит новый пост, остальные читают реплику"""
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='Старый пост', author=author)
+        self.replicate()
+        self.client.force_login(author)
+        response = self.client.post(reverse('posts:post_create'),
+                                    {'text': 'Новый пост'}, follow=True)
+        self.assertIn(routers.PIN_COOKIE, self.client.cookies)
+        self.assertContains(response, 'Новый пост')
+        profile = reverse('posts:profile', args=[author.username])
+        reader = self.client_class()
+        reader.force_login(User.objects.create_user(username='reader'))
+        response = reader.get(profile)
+        self.assertContains(response, 'Старый пост')
+        self.assertNotContains(response, 'Новый пост')
+        routers.begin()
+        self.addCleanup(routers.end)
+        self.assertEqual(Post.objects.count(), 1)
+        with transaction.atomic():
+            self.assertEqual(Post.objects.count(), 2)
+        routers.end()
+        self.replicate()
+        self.assertContains(reader.get(profile), 'Новый пост')
+
+    def test_only_cached_pages_read_primary_for_anonymous(self):
+        """Аноним читает с основной базы только страницы для кэша"""
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(text='Пост', author=author)
+        self.replicate()
+        Post.objects.filter(pk=post.pk).update(text='Исправленный пост')
+        post.comments.create(author=author, text='Новый комментарий')
+        detail = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertContains(detail, 'Исправленный пост')
+        self.assertNotIn(routers.PIN_COOKIE, detail.cookies)
+        comments = self.client.get(
+            reverse('posts:post_comments', args=[post.pk]))
+        self.assertNotContains(comments, 'Новый комментарий')
+
+
+class SqliteBackendTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+
+    def wrapper(self, **options):
+        settings_dict = {**connections['default'].settings_dict,
+                         'NAME': self.path, 'OPTIONS': options}
+        wrapper = DatabaseWrapper(settings_dict, 'pragmas')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_pragmas(self):
+        """Новое соединение работает в WAL с заданными прагмами"""
+        wrapper = self.wrapper(pragmas={'cache_size': -1000})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -1000)
+
+    def test_is_usable_checks_connection(self):
+        """Закрытое соединение не считается пригодным"""
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        self.assertTrue(wrapper.is_usable())
+        wrapper.connection.close()
+        self.assertFalse(wrapper.is_usable())
+
+    def test_benchmark_command(self):
+        """Команда benchmark_sqlite сравнивает оба бэкенда"""
+        out = StringIO()
+        call_command('benchmark_sqlite', duration=0.2, readers=2, writers=1,
+                     rows=100, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]],
+                         ['django', 'core'])
+
+
+class AnonymousPageCacheMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def middleware(self, set_cookie=False):
+        def view(request):
+            pagecache.tag_page(request, 'page')
+            response = HttpResponse('страница')
+            if set_cookie:
+                response.set_cookie('name', 'value')
+            return response
+        return AnonymousPageCacheMiddleware(view)
+
+    def test_response_with_cookies_not_cached(self):
+        """Ответ, который ставит cookie, не попадает в кэш"""
+        self.middleware(set_cookie=True)(self.factory.get('/page/'))
+        self.assertIsNone(pagecache.cached_page(self.factory.get('/page/')))
+        self.middleware()(self.factory.get('/page/'))
+        self.assertIsNotNone(
+            pagecache.cached_page(self.factory.get('/page/')))
+
+    def test_session_cookie_bypasses_cache(self):
+        """Запрос с cookie сессии не читает и не пишет кэш"""
+        request = self.factory.get('/page/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'session'
+        self.middleware()(request)
+        self.assertIsNone(pagecache.cached_page(self.factory.get('/page/')))
+
+    def test_purge_expires_tagged_pages(self):
+        """Сдвиг версии тега делает страницу устаревшей"""
+        self.middleware()(self.factory.get('/page/'))
+        pagecache.purge('other')
+        self.assertIsNotNone(
+            pagecache.cached_page(self.factory.get('/page/')))
+        pagecache.purge('page')
+        self.assertIsNone(pagecache.cached_page(self.factory.get('/page/')))
+
+    def test_versions_survive_data_eviction(self):
+        """Версии тегов не теряются при очистке кэша данных"""
+        versions = pagecache.tag_versions(['page'])
+        cache.clear()
+        self.assertEqual(pagecache.tag_versions(['page']), versions)
@@ -1,7 +1,15 @@
+import time
+
 from django.shortcuts import render
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.views.static import serve
+
+from .storage import is_content_addressed
 
 NOT_FOUND = 404
 INTERNAL_SERVER_ERROR = 500
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
 
 
 def page_not_found(request, exception):
@@ -17,3 +25,13 @@ def csrf_failure(request, reason=''):
 
 def server_error(request):
     return render(request, "core/500.html", status=INTERNAL_SERVER_ERROR)
+
+
+def media(request, path, document_root=None, show_indexes=False):
+    """Раздаёт медиафайлы; названные по хешу кэшируются навсегда."""
+    response = serve(request, path, document_root, show_indexes)
+    if response.status_code == 200 and is_content_addressed(path):
+        patch_cache_control(response, public=True,
+                            max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        response['Expires'] = http_date(time.time() + IMMUTABLE_MAX_AGE)
+    return response
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post
 
 
@@ -15,6 +16,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.fts_available():
+            return super().get_search_results(request, queryset, search_term)
+        if not search.match_expression(search_term):
+            return queryset.none(), False
+        return queryset.filter(pk__in=search.matching_ids(search_term)), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
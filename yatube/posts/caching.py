@@ -0,0 +1,79 @@
+import time
+
+from django.core.cache import caches
+
+from core.pagecache import purge
+
+from .constants import FEED_CACHE_TIMEOUT
+
+VERSION_KEY = 'posts:version:{}'
+FEED_NAMESPACE = 'feed'
+
+
+def versions():
+    """Кэш версий: его записи не вытесняются."""
+    return caches['versions']
+
+
+def get_version(namespace):
+    """Текущая версия данных пространства имён кэша."""
+    return versions().get_or_set(VERSION_KEY.format(namespace), _initial, None)
+
+
+def bump_version(namespace):
+    """Сдвигает версию: все ключи со старой версией перестают читаться."""
+    key = VERSION_KEY.format(namespace)
+    try:
+        versions().incr(key)
+    except ValueError:
+        versions().set(key, _initial(), None)
+
+
+def _initial():
+    # Версия начинается со времени в миллисекундах, чтобы после вытеснения
+    # ключа из кэша она не совпала ни с одной из уже выданных.
+    return int(time.time() * 1000)
+
+
+def post_tags(post_id, author_id, group_id):
+    """Теги страниц, на которых виден пост."""
+    tags = ['index', f'post:{post_id}', f'profile:{author_id}']
+    if group_id is not None:
+        tags.append(f'group:{group_id}')
+    return tags
+
+
+def purge_posts(posts):
+    """Сбрасывает кэш страниц с постами из выборки."""
+    for values in posts.values_list('pk', 'author_id', 'group_id'):
+        purge(*post_tags(*values))
+
+
+def timeline_namespace(user_id):
+    return f'timeline:{user_id}'
+
+
+def feed_cache_context(request, feed):
+    """
+    Ключ и время жизни фрагментного кэша ленты.
+
+    Ключ складывается из типа ленты, страницы или курсора, состояния
+    авторизации и версии данных, которую сдвигают сигналы сохранения
+    и удаления постов, групп и комментариев. Для авторизованных
+    добавляется версия их подписок: от неё зависят лента подписок
+    и кнопки подписки в остальных лентах.
+    """
+    user = request.user
+    parts = [
+        feed,
+        get_version(FEED_NAMESPACE),
+        request.GET.get('page', ''),
+        request.GET.get('cursor', ''),
+        user.pk if user.is_authenticated else 'anonymous',
+    ]
+    if user.is_authenticated:
+        parts.append(get_version(timeline_namespace(user.pk)))
+    return {
+        'feed_cache_key': ':'.join(str(part) for part in parts),
+        'feed_cache_timeout': FEED_CACHE_TIMEOUT,
+    }
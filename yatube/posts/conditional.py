@@ -0,0 +1,82 @@
+"""
+Валидаторы условных GET-запросов для страниц постов.
+
+Проверяются до выполнения представления. Страница описывается теми же
+тегами, что и в pagecache: лента, группа, автор, пост. ETag складывается
+из версий этих тегов, а Last-Modified — из времени последнего изменения
+любого из них, так что изменение одного поста не сбрасывает валидаторы
+остальных страниц.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.views.decorators.http import condition
+
+from core.pagecache import ALL_TAG, tag_versions
+
+from .caching import get_version, timeline_namespace
+from .models import Group, Post, User
+
+
+def page_versions(request, tags, *args, **kwargs):
+    """Версии тегов страницы; считаются один раз за запрос."""
+    if not hasattr(request, '_page_versions'):
+        request._page_versions = tag_versions(
+            [ALL_TAG, *tags(*args, **kwargs)])
+    return request._page_versions
+
+
+def conditional_page(tags):
+    """
+    Декоратор представления с валидаторами по тегам tags(**kwargs).
+
+    В ETag входят пользователь и ключ сессии: вход меняет ключ сессии
+    вместе с секретом CSRF, и страница с формой должна прийти с новым
+    токеном. Last-Modified
+    отдаётся только анонимам: по одной дате нельзя отличить ответ,
+    полученный до входа, от ответа после него.
+    """
+    def etag(request, *args, **kwargs):
+        user = request.user
+        parts = [
+            request.get_full_path(),
+            user.pk if user.is_authenticated else 'anonymous',
+            request.session.session_key,
+        ]
+        if user.is_authenticated:
+            # Подписки пользователя меняют кнопки и ленту подписок.
+            parts.append(get_version(timeline_namespace(user.pk)))
+        versions = page_versions(request, tags, *args, **kwargs)
+        parts += sorted(versions.items())
+        return hashlib.md5(
+            ':'.join(str(part) for part in parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        versions = page_versions(request, tags, *args, **kwargs)
+        return datetime.fromtimestamp(max(versions.values()) / 1000,
+                                      timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def index_tags():
+    return ['index']
+
+
+def group_tags(slug):
+    return [f'group:{pk}' for pk in
+            Group.objects.filter(slug=slug).values_list('pk', flat=True)]
+
+
+def profile_tags(username):
+    return [f'profile:{pk}' for pk in User.objects.filter(
+        username=username).values_list('pk', flat=True)]
+
+
+def post_detail_tags(post_id):
+    author_ids = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True)
+    return [f'post:{post_id}',
+            *(f'profile:{author_id}' for author_id in author_ids)]
@@ -1,2 +1,17 @@
 PER_PAGE = 10
 PER_LEN = 15
+PAGE_WINDOW = 2
+COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+TIMELINE_SIZE = 1000
+FANOUT_MAX_FOLLOWERS = 10000
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+POST_FRAGMENT_TIMEOUT = 60 * 60 * 24
+COMMENTS_PER_PAGE = 20
+POST_THUMBNAILS = (('960x339', {'upscale': True}),)
+IMAGE_VARIANT_WIDTHS = (320, 640, 960, 1280)
+IMAGE_VARIANT_FORMATS = ('WEBP', 'JPEG')
+IMAGE_VARIANT_QUALITY = 80
+UPLOAD_MAX_SIZE = (2560, 2560)
+UPLOAD_MAX_PIXELS = 50 * 1000 * 1000
+UPLOAD_FORMAT = 'WEBP'
+UPLOAD_QUALITY = 82
@@ -0,0 +1,98 @@
+"""
+Денормализованные счётчики постов, комментариев и подписок.
+
+Значения меняются атомарно выражениями F() в том же запросе UPDATE,
+поэтому параллельные запросы не теряют инкременты. Расхождения, если
+они накопились, исправляет команда reconcile_counters.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserCounter
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    if user_id is None:
+        return
+    counters = UserCounter.objects.filter(user_id=user_id)
+    if not _change(counters, field, delta) and delta > 0:
+        UserCounter.objects.get_or_create(user_id=user_id)
+        _change(counters, field, delta)
+
+
+def change_post(post_id, delta):
+    if post_id is None:
+        return
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _total(model, field):
+    totals = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(totals), 0)
+
+
+def reconcile_users(start, batch_size):
+    """
+    Сверяет счётчики пачки пользователей с pk > start.
+
+    Возвращает pk последнего обработанного пользователя и число
+    исправленных строк; None вместо pk означает, что пользователи
+    закончились.
+    """
+    users = list(
+        User.objects.filter(pk__gt=start).order_by('pk').annotate(
+            real_posts=_total(Post, 'author'),
+            real_followers=_total(Follow, 'author'),
+            real_following=_total(Follow, 'user'),
+        ).values_list('pk', 'real_posts', 'real_followers',
+                      'real_following')[:batch_size]
+    )
+    if not users:
+        return None, 0
+    counters = UserCounter.objects.in_bulk(
+        [row[0] for row in users], field_name='user_id'
+    )
+    changed, created = [], []
+    for pk, posts, followers, following in users:
+        actual = (posts, followers, following)
+        counter = counters.get(pk)
+        if counter is None:
+            created.append(UserCounter(
+                user_id=pk, posts_count=posts,
+                followers_count=followers, following_count=following,
+            ))
+        elif actual != (counter.posts_count, counter.followers_count,
+                        counter.following_count):
+            (counter.posts_count, counter.followers_count,
+             counter.following_count) = actual
+            changed.append(counter)
+    UserCounter.objects.bulk_create(created, ignore_conflicts=True)
+    UserCounter.objects.bulk_update(
+        changed, ['posts_count', 'followers_count', 'following_count']
+    )
+    return users[-1][0], len(changed) + len(created)
+
+
+def reconcile_posts(start, batch_size):
+    """Сверяет число комментариев у пачки постов с pk > start."""
+    posts = list(
+        Post.objects.filter(pk__gt=start).order_by('pk').annotate(
+            real_comments=_total(Comment, 'post'),
+        ).only('pk', 'comments_count')[:batch_size]
+    )
+    if not posts:
+        return None, 0
+    changed = [post for post in posts
+               if post.comments_count != post.real_comments]
+    for post in changed:
+        post.comments_count = post.real_comments
+    Post.objects.bulk_update(changed, ['comments_count'])
+    return posts[-1].pk, len(changed)
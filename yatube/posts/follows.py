@@ -0,0 +1,50 @@
+"""
+Подписан ли пользователь запроса на авторов.
+
+Для выборки признак добавляется подзапросом EXISTS в тот же запрос,
+для списка — берётся из множества id авторов, на которых подписан
+пользователь; множество читается одним запросом и запоминается
+в запросе, так что любое число списков на странице стоит один запрос.
+"""
+from django.db.models import BooleanField, Exists, OuterRef, QuerySet, Value
+
+from .models import Follow, User
+
+FIELD = 'is_followed_by_request_user'
+
+
+def followed_ids(request):
+    """id авторов, на которых подписан пользователь; раз за запрос."""
+    if not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_followed_ids'):
+        request._followed_ids = frozenset(
+            Follow.objects.filter(user=request.user)
+            .values_list('author_id', flat=True))
+    return request._followed_ids
+
+
+def author_id(obj):
+    """Автор поста или сам пользователь."""
+    return obj.pk if isinstance(obj, User) else obj.author_id
+
+
+def annotate_follow_state(request, objects):
+    """
+    Добавляет постам или пользователям признак is_followed_by_request_user.
+
+    Выборка аннотируется без выполнения, список размечается на месте.
+    """
+    if isinstance(objects, QuerySet):
+        if not request.user.is_authenticated:
+            return objects.annotate(
+                **{FIELD: Value(False, output_field=BooleanField())})
+        author = 'pk' if objects.model is User else 'author_id'
+        return objects.annotate(**{FIELD: Exists(Follow.objects.filter(
+            user=request.user, author=OuterRef(author)))})
+    objects = list(objects)
+    if objects:
+        followed = followed_ids(request)
+        for obj in objects:
+            setattr(obj, FIELD, author_id(obj) in followed)
+    return objects
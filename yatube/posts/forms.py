@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from . import uploads
 from .models import Post, Comment
 
 
@@ -7,6 +10,12 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return uploads.process(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
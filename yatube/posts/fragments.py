@@ -0,0 +1,52 @@
+"""
+Кэш отрисованных постов лент.
+
+Разметка поста в ленте зависит от самого поста, а также от имени и
+логина автора и адреса группы, поэтому она кэшируется по ключу
+(pk, updated_at, отпечаток автора и группы): правка поста, появление
+его миниатюр и вариантов картинки, переименование автора или группы
+меняют ключ, и старая разметка больше не читается. Страница ленты
+собирается из фрагментов одним get_many; отрисовываются, вместе
+с поиском их картинок, только промахи.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from . import thumbnails, variants
+from .constants import POST_FRAGMENT_TIMEOUT
+
+FRAGMENT_KEY = 'posts:fragment:{}:{}:{}:{}'
+TEMPLATE = 'posts/includes/post_fragment.html'
+
+
+def fragment_key(post, with_group):
+    author = post.author
+    related = (author.username, author.get_full_name(),
+               post.group.slug if post.group_id else '')
+    digest = hashlib.md5(repr(related).encode()).hexdigest()
+    return FRAGMENT_KEY.format(post.pk, post.updated_at.timestamp(),
+                               int(with_group), digest)
+
+
+def render_posts(posts, with_group=True):
+    """Разметка постов по порядку: из кэша, а промахи — заново."""
+    posts = list(posts)
+    keys = [fragment_key(post, with_group) for post in posts]
+    fragments = cache.get_many(keys)
+    missing = [post for post, key in zip(posts, keys)
+               if key not in fragments]
+    if missing:
+        thumbnails.prefetch(missing)
+        variants.prefetch(missing)
+        template = get_template(TEMPLATE)
+        rendered = {
+            fragment_key(post, with_group): template.render(
+                {'post': post, 'with_group': with_group})
+            for post in missing
+        }
+        cache.set_many(rendered, POST_FRAGMENT_TIMEOUT)
+        fragments.update(rendered)
+    return [mark_safe(fragments[key]) for key in keys]
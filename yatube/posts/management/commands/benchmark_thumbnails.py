@@ -0,0 +1,121 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from PIL import Image
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.parsers import parse_geometry
+
+DEFAULT_ENGINES = ('sorl.thumbnail.engines.pil_engine.Engine',
+                   'posts.thumbnail_engine.Engine')
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+def peak_rss():
+    """Пиковый размер резидентной памяти процесса в КиБ."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def make_corpus(directory, count, size):
+    """Набор больших JPEG, похожих на фотографии по сжимаемости."""
+    for i in range(count):
+        layers = [
+            Image.linear_gradient('L').rotate(i * 30).resize(size),
+            Image.radial_gradient('L').resize(size),
+            Image.effect_noise(size, 40 + i),
+        ]
+        Image.merge('RGB', layers).save(
+            os.path.join(directory, f'photo-{i}.jpg'), 'JPEG', quality=90)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время и пиковую память движков миниатюр sorl на наборе '
+        'больших картинок; каждый движок запускается в отдельном процессе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus',
+                            help='Каталог с картинками; по умолчанию '
+                                 'создаётся синтетический набор')
+        parser.add_argument('--count', type=int, default=5,
+                            help='Число картинок синтетического набора')
+        parser.add_argument('--size', default='6000x4000',
+                            help='Размер картинок синтетического набора')
+        parser.add_argument('--geometry', default='960x339')
+        parser.add_argument('--engine', action='append', dest='engines',
+                            help='Путь к движку; можно указать несколько раз')
+        parser.add_argument('--child', action='store_true',
+                            help='Служебный режим: прогон одного движка')
+
+    def handle(self, *args, **options):
+        engines = options['engines'] or DEFAULT_ENGINES
+        if options['child']:
+            return self.run_engine(engines[0], options)
+        with tempfile.TemporaryDirectory() as corpus:
+            if options['corpus']:
+                corpus = options['corpus']
+            else:
+                width, _, height = options['size'].partition('x')
+                make_corpus(corpus, options['count'],
+                            (int(width), int(height)))
+            results = [self.spawn(engine, corpus, options)
+                       for engine in engines]
+        self.stdout.write(f'{"движок":<45}{"картинок":>9}{"с":>9}'
+                          f'{"мс/шт":>9}{"пик RSS, МиБ":>14}')
+        for result in results:
+            self.stdout.write(
+                f'{result["engine"]:<45}{result["images"]:>9}'
+                f'{result["seconds"]:>9.2f}'
+                f'{result["seconds"] * 1000 / result["images"]:>9.0f}'
+                f'{result["peak_rss_delta"] / 1024:>14.1f}'
+            )
+
+    def spawn(self, engine, corpus, options):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+            'benchmark_thumbnails', '--child', '--engine', engine,
+            '--corpus', corpus, '--geometry', options['geometry'],
+        ]
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f'{engine}: {process.stderr}')
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def run_engine(self, path, options):
+        engine = import_string(path)()
+        names = sorted(name for name in os.listdir(options['corpus'])
+                       if name.lower().endswith(EXTENSIONS))
+        if not names:
+            raise CommandError('В каталоге нет картинок')
+        source_storage = FileSystemStorage(options['corpus'])
+        baseline = peak_rss()
+        with tempfile.TemporaryDirectory() as output:
+            output_storage = FileSystemStorage(output)
+            started = time.perf_counter()
+            for name in names:
+                opts = dict(ThumbnailBackend.default_options, upscale=True)
+                source = engine.get_image(ImageFile(name, source_storage))
+                geometry = parse_geometry(
+                    options['geometry'], engine.get_image_ratio(source, opts))
+                thumbnail = engine.create(source, geometry, opts)
+                engine.write(thumbnail, opts,
+                             ImageFile(f'{name}.jpg', output_storage))
+                engine.cleanup(source)
+            seconds = time.perf_counter() - started
+        self.stdout.write(json.dumps({
+            'engine': path,
+            'images': len(names),
+            'seconds': seconds,
+            'peak_rss': peak_rss(),
+            'peak_rss_delta': peak_rss() - baseline,
+        }))
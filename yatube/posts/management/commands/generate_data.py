@@ -0,0 +1,231 @@
+import io
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.pagecache import ALL_TAG, purge
+from posts import timeline
+from posts.caching import FEED_NAMESPACE, bump_version
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import COUNT_NAMESPACE
+
+# Размер набора данных при --scale 1.
+USERS = 1000
+GROUPS = 20
+POSTS = 50000
+COMMENTS = 100000
+FOLLOW_DEGREE = 20
+DAYS = 365
+IMAGES = 10
+PASSWORD = 'yatube-password'
+WORDS = ('yatube', 'котики', 'python', 'django', 'новости', 'погода',
+         'музыка', 'кино', 'книги', 'путешествия', 'спорт', 'рецепты')
+
+
+@contextmanager
+def manual_pub_date(*fields):
+    """Временно отключает auto_now_add, чтобы задать даты вручную."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса закона Ципфа: немногие объекты популярнее всех."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует детерминированный набор пользователей, групп, постов, '
+        'комментариев и подписок для нагрузочного тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Множитель размера набора данных')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='gen',
+                            help='Префикс имён пользователей и слагов групп')
+        parser.add_argument('--follow-degree', type=float,
+                            default=FOLLOW_DEGREE,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель степени популярности авторов')
+        parser.add_argument('--images', type=float, default=0.0,
+                            help='Доля постов с картинкой, от 0 до 1')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Не пересчитывать счётчики и ленты')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.prefix = options['prefix']
+        scale = options['scale']
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {self.prefix!r} уже есть, '
+                f'задайте другой --prefix'
+            )
+        self.now = timezone.now()
+        self.rows = 0
+        self.started = time.monotonic()
+
+        users = self.create_users(max(int(USERS * scale), 2))
+        groups = self.create_groups(max(int(GROUPS * scale), 1))
+        authors = zipf_weights(len(users), options['zipf'])
+        posts = self.create_posts(int(POSTS * scale), users, groups,
+                                  authors, options['images'])
+        self.create_comments(int(COMMENTS * scale), users, posts,
+                             options['zipf'])
+        self.create_follows(users, authors, options['follow_degree'])
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {self.rows} строк за {elapsed:.1f} с: '
+            f'{self.rows / elapsed:.0f} строк/с'
+        ))
+        if not options['skip_derived']:
+            self.rebuild_derived(users)
+        bump_version(FEED_NAMESPACE)
+        bump_version(COUNT_NAMESPACE)
+        purge(ALL_TAG)
+
+    def bulk_create(self, model, objects):
+        started = time.monotonic()
+        total = 0
+        objects = iter(objects)
+        while True:
+            chunk = list(itertools.islice(objects, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, batch_size=500)
+            total += len(chunk)
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.rows += total
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {total} строк, '
+            f'{total / elapsed:.0f} строк/с'
+        )
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        self.bulk_create(User, (
+            User(username=f'{self.prefix}{i}', password=password,
+                 first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                 date_joined=self.now)
+            for i in range(count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=self.prefix
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_groups(self, count):
+        self.bulk_create(Group, (
+            Group(title=f'Группа {i}', slug=f'{self.prefix}-group-{i}',
+                  description=f'Описание группы {i}')
+            for i in range(count)
+        ))
+        return list(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-group-'
+        ).values_list('pk', flat=True))
+
+    def create_images(self, count):
+        from PIL import Image
+
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for i in range(count):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', (1280, 720), color).save(buffer, 'JPEG')
+            names.append(storage.save(
+                f'posts/{self.prefix}-{i}.jpg', ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def create_posts(self, count, users, groups, authors, image_share):
+        rng = self.rng
+        images = self.create_images(IMAGES) if image_share else []
+        span = timedelta(days=DAYS).total_seconds()
+        first_pk = (Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0) + 1
+        chosen = rng.choices(users, cum_weights=authors, k=count)
+
+        def posts():
+            for i, author_id in enumerate(chosen):
+                yield Post(
+                    text=f'Пост {i} ' + ' '.join(
+                        rng.choices(WORDS, k=rng.randint(5, 40))),
+                    author_id=author_id,
+                    group_id=rng.choice(groups) if rng.random() < 0.7
+                    else None,
+                    image=rng.choice(images)
+                    if images and rng.random() < image_share else '',
+                    pub_date=self.now - timedelta(
+                        seconds=span * (count - i) / count),
+                )
+
+        with manual_pub_date(Post._meta.get_field('pub_date')):
+            self.bulk_create(Post, posts())
+        return list(Post.objects.filter(pk__gte=first_pk).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def create_comments(self, count, users, posts, exponent):
+        if not posts:
+            return
+        rng = self.rng
+        popular = rng.choices(posts, cum_weights=zipf_weights(
+            len(posts), exponent), k=count)
+        self.bulk_create(Comment, (
+            Comment(post_id=post_id, author_id=rng.choice(users),
+                    text=f'Комментарий {i}')
+            for i, post_id in enumerate(popular)
+        ))
+
+    def create_follows(self, users, authors, degree):
+        rng = self.rng
+
+        def follows():
+            for user_id in users:
+                # Число подписок распределено экспоненциально вокруг
+                # среднего: большинство читает немногих, единицы — сотни.
+                size = min(int(rng.expovariate(1 / degree)), len(users) - 1)
+                targets = set(rng.choices(users, cum_weights=authors,
+                                          k=size))
+                targets.discard(user_id)
+                for author_id in sorted(targets):
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        self.bulk_create(Follow, follows())
+
+    def rebuild_derived(self, users):
+        started = time.monotonic()
+        call_command('reconcile_counters', stdout=self.stdout)
+        self.stdout.write(
+            f'Счётчики пересчитаны за {time.monotonic() - started:.1f} с'
+        )
+        started = time.monotonic()
+        with transaction.atomic():
+            for user_id in users:
+                timeline.rebuild(user_id)
+        self.stdout.write(
+            f'Ленты собраны за {time.monotonic() - started:.1f} с'
+        )
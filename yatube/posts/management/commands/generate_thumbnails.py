@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails, variants
+from posts.models import Post
+from tasks.queue import enqueue
+
+
+class Command(BaseCommand):
+    help = (
+        'Ставит в очередь задач создание недостающих миниатюр и адаптивных '
+        'вариантов уже загруженных картинок постов; параллельно их '
+        'выполняют обработчики run_tasks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inline', action='store_true',
+                            help='Выполнить в текущем процессе')
+
+    def jobs(self):
+        posts = Post.objects.exclude(image='')
+        names = sorted(set(posts.values_list('image', flat=True)))
+        jobs = [(thumbnails.generate, name) for name in names
+                if thumbnails.missing(name)]
+        jobs += [(variants.generate, name)
+                 for name in variants.missing(names)]
+        return jobs
+
+    def handle(self, *args, **options):
+        jobs = self.jobs()
+        if not options['inline']:
+            for function, arg in jobs:
+                enqueue(function, arg)
+            self.stdout.write(self.style.SUCCESS(
+                f'Поставлено задач: {len(jobs)}'))
+            return
+        failed = 0
+        for function, arg in jobs:
+            try:
+                function(arg)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{arg}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Задач выполнено: {len(jobs) - failed}, ошибок: {failed}'
+        ))
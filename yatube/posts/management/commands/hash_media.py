@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.pagecache import ALL_TAG, purge
+from core.storage import is_content_addressed
+from posts.caching import FEED_NAMESPACE, bump_version
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов под имена по хешу содержимого и '
+        'переписывает ссылки на них пачками; после переноса миниатюры '
+        'создаёт команда generate_thumbnails'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--delete-old', action='store_true',
+                            help='Удалять файлы под старыми именами')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        posts = Post.objects.exclude(image='').order_by('pk')
+        last_pk = 0
+        renamed = missing = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk).values_list(
+                'pk', 'image')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            renames = {}
+            for pk, name in batch:
+                if name in renames or is_content_addressed(name):
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f'Пост {pk}: нет файла {name}')
+                    continue
+                with storage.open(name) as file:
+                    renames[name] = storage.save(name, file)
+            with transaction.atomic():
+                for old, new in renames.items():
+                    Post.objects.filter(image=old).update(
+                        image=new, updated_at=timezone.now())
+            if options['delete_old']:
+                for old in renames:
+                    storage.delete(old)
+            renamed += len(renames)
+        if renamed:
+            bump_version(FEED_NAMESPACE)
+            purge(ALL_TAG)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {renamed}, не найдено: {missing}'
+        ))
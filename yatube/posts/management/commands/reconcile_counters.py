@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_posts, reconcile_users
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        for name, reconcile in (('users', reconcile_users),
+                                ('posts', reconcile_posts)):
+            start, fixed = 0, 0
+            while start is not None:
+                start, changed = reconcile(start, batch_size)
+                fixed += changed
+            self.stdout.write(f'{name}: исправлено {fixed}')
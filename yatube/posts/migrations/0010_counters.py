@@ -0,0 +1,62 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounter = apps.get_model('posts', 'UserCounter')
+
+    def totals(queryset, field):
+        return dict(
+            queryset.order_by().values_list(field).annotate(Count('pk'))
+        )
+
+    posts = totals(Post.objects.all(), 'author_id')
+    followers = totals(Follow.objects.all(), 'author_id')
+    following = totals(Follow.objects.all(), 'user_id')
+    UserCounter.objects.bulk_create(
+        (UserCounter(user_id=pk,
+                     posts_count=posts.get(pk, 0),
+                     followers_count=followers.get(pk, 0),
+                     following_count=following.get(pk, 0))
+         for pk in User.objects.values_list('pk', flat=True).iterator()),
+        batch_size=500,
+    )
+    for post_id, total in totals(
+        apps.get_model('posts', 'Comment').objects.all(), 'post_id'
+    ).items():
+        if post_id is not None:
+            Post.objects.filter(pk=post_id).update(comments_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='counter', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+import core.storage
+from django.db import migrations, models
+
+
+def copy_source(apps, schema_editor):
+    # Варианты теперь общие для картинки: оставляем по одному набору
+    # на имя картинки, остальные записи — дубли.
+    PostImageVariant = apps.get_model('posts', 'PostImageVariant')
+    seen = set()
+    duplicates = []
+    variants = PostImageVariant.objects.select_related('post').order_by('pk')
+    for variant in variants.iterator():
+        key = (variant.post.image, variant.format, variant.width)
+        if key in seen:
+            duplicates.append(variant.pk)
+            continue
+        seen.add(key)
+        variant.source = variant.post.image
+        variant.save(update_fields=['source'])
+    PostImageVariant.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='postimagevariant',
+            name='unique_post_image_variant',
+        ),
+        migrations.AddField(
+            model_name='postimagevariant',
+            name='source',
+            field=models.CharField(default='', max_length=100, verbose_name='Исходная картинка'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_source, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='postimagevariant',
+            name='post',
+        ),
+        migrations.AlterField(
+            model_name='postimagevariant',
+            name='image',
+            field=models.ImageField(storage=core.storage.ContentHashStorage(), upload_to='posts/variants/', verbose_name='Картинка'),
+        ),
+        migrations.AddConstraint(
+            model_name='postimagevariant',
+            constraint=models.UniqueConstraint(fields=('source', 'format', 'width'), name='unique_image_variant'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+
+from core.storage import ContentHashStorage
 from .constants import PER_LEN
 
 User = get_user_model()
@@ -19,6 +21,7 @@ class Post(models.Model):
                             help_text='Введите текст поста')
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -36,13 +39,46 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentHashStorage(),
         blank=True)
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False)
+
+    # Счётчики меняют только F()-обновления из counters.
+    COUNTER_FIELDS = ('comments_count',)
 
     def __str__(self):
         return f'{self.text[:PER_LEN]}'
 
+    def save(self, *args, **kwargs):
+        """
+        Сохраняет пост; существующий — без полей-счётчиков.
+
+        Иначе сохранение поста, загруженного до нового комментария,
+        затёрло бы счётчик старым значением.
+        """
+        if (not args and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(fields=['pub_date', 'id'],
+                         name='post_pub_date_id_idx'),
+            models.Index(fields=['author', 'pub_date', 'id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date', 'id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -62,6 +98,12 @@ class Comment(models.Model):
     created = models.DateTimeField(verbose_name='Дата публикации',
                                    auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -77,8 +119,76 @@ class Follow(models.Model):
         related_name='following')
 
     class Meta:
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique_author_user_following'
             )
         ]
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline')
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(fields=['user', 'pub_date'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_user_post'
+            )
+        ]
+
+
+class UserCounter(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='counter')
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField('Число подписчиков',
+                                                  default=0)
+    following_count = models.PositiveIntegerField('Число подписок',
+                                                  default=0)
+
+
+class PostImageVariant(models.Model):
+    """
+    Уменьшенная копия картинки поста для srcset.
+
+    Варианты принадлежат картинке, а не посту: имя картинки — хеш её
+    содержимого, и посты с одной картинкой делят одни варианты.
+    """
+    source = models.CharField('Исходная картинка', max_length=100)
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/variants/',
+        storage=ContentHashStorage())
+    format = models.CharField('Формат', max_length=10)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+
+    class Meta:
+        ordering = ['width']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'format', 'width'],
+                name='unique_image_variant'
+            )
+        ]
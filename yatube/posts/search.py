@@ -0,0 +1,85 @@
+"""
+Полнотекстовый поиск по постам.
+
+На SQLite текст постов индексируется виртуальной таблицей FTS5, которую
+синхронизируют триггеры на posts_post; результаты ранжируются по bm25.
+Таблицу и триггеры создают миграции 0011, 0013 и 0015.
+На других СУБД поиск откатывается к фильтру icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .constants import PER_PAGE
+from .models import Post
+from .utils import (NEXT, CursorPage, cursor_paginate, decode_cursor,
+                    encode_cursor, parse_pk)
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """
+    Переводит пользовательский запрос в безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки, поэтому синтаксис FTS5 из запроса
+    не интерпретируется; последнее слово ищется как префикс.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return ''
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def matching_ids(query):
+    """Подзапрос с id постов, подходящих под запрос, для filter(pk__in=)."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match_expression(query)],
+    )
+
+
+def search_page(query, cursor=None, per_page=PER_PAGE):
+    """Страница найденных постов, от самых релевантных."""
+    expression = match_expression(query)
+    if not expression:
+        return CursorPage([])
+    if not fts_available():
+        return cursor_paginate(
+            Post.objects.filter(text__icontains=query)
+            .select_related('author', 'group'),
+            cursor, per_page,
+        )
+    sql = (f'SELECT rowid, rank FROM {FTS_TABLE} '
+           f'WHERE {FTS_TABLE} MATCH %s')
+    params = [expression]
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded is not None and decoded[0] == NEXT:
+        try:
+            rank, pk = float(decoded[1][0]), parse_pk(decoded[1][1])
+        except (IndexError, OverflowError, TypeError, ValueError):
+            pass
+        else:
+            sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+            params += [rank, rank, pk]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(per_page + 1)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchall()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(NEXT, (rows[-1][1], rows[-1][0]))
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for pk, rank in rows]
+    )
+    return CursorPage([posts[pk] for pk, rank in rows if pk in posts],
+                      next_cursor)
@@ -0,0 +1,129 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.pagecache import ALL_TAG, purge
+
+from . import counters, timeline
+from .caching import (FEED_NAMESPACE, bump_version, post_tags,
+                      timeline_namespace)
+from .models import Comment, Follow, Group, Post, User, UserCounter
+from .utils import COUNT_NAMESPACE
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_counts(sender, **kwargs):
+    bump_version(COUNT_NAMESPACE)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def drop_from_timeline(sender, instance, **kwargs):
+    timeline.drop(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_feeds(sender, **kwargs):
+    bump_version(FEED_NAMESPACE)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_pages(sender, instance, **kwargs):
+    # Пост могли перенести в другую группу: старую страницу тоже сбросить.
+    instance.previous_tags = []
+    if instance.pk is not None:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'author_id', 'group_id').first()
+        if previous is not None:
+            instance.previous_tags = post_tags(instance.pk, *previous)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    purge(*post_tags(instance.pk, instance.author_id, instance.group_id),
+          *getattr(instance, 'previous_tags', []))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    purge(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_follow_pages(sender, instance, **kwargs):
+    purge(f'profile:{instance.author_id}', f'profile:{instance.user_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, **kwargs):
+    # Название группы выводится в постах на всех страницах.
+    purge(ALL_TAG)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_timeline(sender, instance, **kwargs):
+    bump_version(timeline_namespace(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def create_counter(sender, instance, created, **kwargs):
+    if created:
+        UserCounter.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'followers_count', -1)
+    counters.change_user(instance.user_id, 'following_count', -1)
@@ -0,0 +1,33 @@
+from django import template
+
+from posts import fragments, thumbnails, variants
+from posts.follows import annotate_follow_state
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(image, geometry, **options):
+    """Готовая миниатюра картинки, а пока её нет — сама картинка."""
+    return thumbnails.ready(image, geometry, **options) or image
+
+
+@register.simple_tag
+def image_srcset(post, image_format):
+    """srcset из вариантов картинки поста в заданном формате."""
+    return variants.srcset(post, image_format)
+
+
+@register.simple_tag(takes_context=True)
+def post_fragments(context, posts, with_group=True, follow_state=True):
+    """
+    Пары (пост, разметка) страницы: разметка собрана из кэша фрагментов.
+
+    С follow_state посты размечаются признаком подписки на автора;
+    лентам, где подписка на всех авторов известна заранее, он не нужен.
+    """
+    if follow_state:
+        posts = annotate_follow_state(context['request'], posts)
+    else:
+        posts = list(posts)
+    return list(zip(posts, fragments.render_posts(posts, with_group)))
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.storage import is_content_addressed
+
+from ..models import Comment, Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class GenerateDataTest(TestCase):
+    def generate(self, prefix):
+        call_command('generate_data', scale=0.01, seed=7, prefix=prefix,
+                     stdout=StringIO())
+        return list(Post.objects.filter(
+            author__username__startswith=prefix
+        ).order_by('pk').values_list('text', 'author__username'))
+
+    def test_generate_data_is_deterministic(self):
+        """Один и тот же seed даёт один и тот же набор данных."""
+        first = self.generate('a')
+        second = self.generate('b')
+        self.assertEqual(len(first), 500)
+        self.assertEqual([text for text, _ in first],
+                         [text for text, _ in second])
+        self.assertEqual(Comment.objects.count(), 2000)
+
+    def test_generate_data_builds_derived_data(self):
+        """После генерации пересчитаны счётчики и ленты."""
+        self.generate('gen')
+        follow = Follow.objects.first()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follow.user, post__author=follow.author).exists())
+        author = Post.objects.first().author
+        self.assertEqual(author.counter.posts_count, author.posts.count())
+
+    def test_generate_data_stores_hashed_images(self):
+        """Картинки сохраняются через хранилище поля под именами-хешами."""
+        with tempfile.TemporaryDirectory() as root, \
+                override_settings(MEDIA_ROOT=root):
+            call_command('generate_data', scale=0.01, seed=7, prefix='img',
+                         images=0.5, stdout=StringIO())
+            names = set(Post.objects.exclude(image='').values_list(
+                'image', flat=True))
+        self.assertTrue(names)
+        self.assertTrue(all(is_content_addressed(name) for name in names))
+
+
+class HashMediaTest(TestCase):
+    def test_hash_media_renames_and_dedupes(self):
+        """Команда переносит картинки под имена-хеши и правит ссылки"""
+        user = User.objects.create_user(username='legacy')
+        with tempfile.TemporaryDirectory() as root, \
+                override_settings(MEDIA_ROOT=root):
+            plain = FileSystemStorage(root)
+            names = [plain.save(f'posts/old{i}.gif', ContentFile(b'same'))
+                     for i in range(2)]
+            posts = [Post.objects.create(author=user, text=name, image=name)
+                     for name in names + ['posts/lost.gif']]
+            call_command('hash_media', batch_size=1, delete_old=True,
+                         stdout=StringIO(), stderr=StringIO())
+            updated = {post.pk: post.updated_at
+                       for post in Post.objects.filter(author=user)}
+            self.assertGreater(updated[posts[0].pk], posts[0].updated_at)
+            self.assertEqual(updated[posts[2].pk], posts[2].updated_at)
+            images = {post.pk: post.image.name
+                      for post in Post.objects.filter(author=user)}
+            hashed = f'posts/{hashlib.sha256(b"same").hexdigest()}.gif'
+            self.assertEqual(images, {posts[0].pk: hashed,
+                                      posts[1].pk: hashed,
+                                      posts[2].pk: 'posts/lost.gif'})
+            self.assertEqual(os.listdir(os.path.join(root, 'posts')),
+                             [os.path.basename(hashed)])
+
+
+class BenchmarkThumbnailsTest(SimpleTestCase):
+    def test_benchmark_command(self):
+        """Бенчмарк сравнивает движки в отдельных процессах"""
+        out = StringIO()
+        call_command('benchmark_thumbnails', count=1, size='1200x900',
+                     stdout=out)
+        for engine in ('pil_engine.Engine', 'posts.thumbnail_engine.Engine'):
+            self.assertIn(engine, out.getvalue())
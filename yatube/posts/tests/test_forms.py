@@ -1,7 +1,17 @@
+import shutil
+import tempfile
 from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+
+from posts import uploads
 from posts.models import Group, Post
 
 User = get_user_model()
@@ -69,3 +79,53 @@ class PostsFormsTest(TestCase):
             text='Новый текст',
             group=self.group
         ).exists())
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def upload(self, size, image_format='JPEG', **params):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'navy').save(buffer, image_format, **params)
+        return SimpleUploadedFile(f'photo.{image_format.lower()}',
+                                  buffer.getvalue())
+
+    def create(self, image):
+        return self.client.post(reverse('posts:post_create'),
+                                {'text': 'Фото', 'image': image})
+
+    def test_upload_is_capped_reencoded_and_stripped(self):
+        """Картинка уменьшается, перекодируется и теряет метаданные"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        self.create(self.upload((4000, 3000), exif=exif.tobytes()))
+        image = Image.open(Post.objects.get(text='Фото').image)
+        self.assertEqual(image.format, 'WEBP')
+        self.assertEqual(image.size, (1920, 2560))
+        self.assertFalse(image.getexif())
+        self.assertTrue(Post.objects.get(text='Фото').image.name.endswith(
+            '.webp'))
+
+    def test_decompression_bomb_rejected(self):
+        """Картинка со слишком большим числом пикселей отклоняется"""
+        with mock.patch.object(uploads, 'UPLOAD_MAX_PIXELS', 100):
+            response = self.create(self.upload((20, 20), 'PNG'))
+        self.assertFormError(response, 'form', 'image',
+                             'Картинка слишком большая: не больше 0 Мп.')
+        self.assertFalse(Post.objects.filter(text='Фото').exists())
@@ -1,8 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+
 from ..constants import PER_LEN
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, UserCounter
 
 User = get_user_model()
 
@@ -54,3 +58,54 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def counter(self, user):
+        return UserCounter.objects.get(user=user)
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(self.counter(self.author).posts_count, 1)
+        self.assertEqual(self.counter(self.author).followers_count, 1)
+        self.assertEqual(self.counter(self.reader).following_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.counter(self.author).followers_count, 0)
+        self.assertEqual(self.counter(self.reader).following_count, 0)
+
+    def test_post_save_keeps_concurrent_comment_count(self):
+        """Сохранение устаревшего поста не затирает счётчик комментариев."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(author=self.reader, post=post,
+                               text='Комментарий')
+        post.text = 'Исправленный пост'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Исправленный пост')
+        self.assertEqual(post.comments_count, 1)
+        post.delete()
+        self.assertEqual(self.counter(self.author).posts_count, 0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}') for i in range(3)
+        )
+        UserCounter.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.counter(self.author).posts_count, 3)
+        self.assertTrue(UserCounter.objects.filter(user=self.reader).exists())
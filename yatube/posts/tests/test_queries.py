@@ -0,0 +1,197 @@
+import re
+from collections import Counter
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from about import urls as about_urls
+from posts import urls as posts_urls
+from users import urls as users_urls
+
+from .. import timeline
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+USERS = 15
+GROUPS = 3
+POSTS = 60
+COMMENTS = 40
+
+# Таблицы лент: запросы к ним обязаны идти по индексу без сортировки.
+FEED_TABLES = ('posts_post', 'posts_comment', 'posts_follow',
+               'posts_timelineentry')
+FEED_URLS = ('posts:index', 'posts:group_list', 'posts:profile',
+             'posts:post_detail', 'posts:post_comments', 'posts:follow_index')
+FULL_SCAN = re.compile(r'SCAN (TABLE )?\w+( AS \w+)?$')
+
+# Бюджеты рассчитаны на холодный кэш и авторизованного автора постов;
+# в них входит поиск объекта страницы для валидаторов conditional.
+QUERY_BUDGETS = {
+    'posts:index': 5,
+    'posts:group_list': 7,
+    'posts:profile': 5,
+    'posts:post_detail': 5,
+    'posts:post_create': 3,
+    'posts:post_edit': 5,
+    'posts:add_comment': 3,
+    'posts:post_comments': 2,
+    'posts:follow_index': 5,
+    'posts:profile_follow': 4,
+    'posts:profile_unfollow': 8,
+    'posts:search': 3,
+    'users:signup': 2,
+    'users:logout': 4,
+    'users:login': 2,
+    'users:password_change': 2,
+    'users:password_change_done': 2,
+    'users:password_reset': 2,
+    'users:password_reset_done': 2,
+    'users:password_reset_confirm': 5,
+    'users:password_reset_complete': 2,
+    'about:author': 2,
+    'about:tech': 2,
+}
+
+
+def _shape(sql):
+    """SQL без литералов: одинаковые запросы N+1 совпадают по форме."""
+    return re.sub(r"'[^']*'|\b\d+\b", '?', sql)
+
+
+def query_plan(sql):
+    """Строки EXPLAIN QUERY PLAN запроса SQLite."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(sql):
+    """Полные сканы таблиц и сортировки во временном B-дереве."""
+    return [detail for detail in query_plan(sql)
+            if FULL_SCAN.match(detail) or 'TEMP B-TREE' in detail]
+
+
+class FeedDataTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(username=f'user{i}')
+                 for i in range(USERS)]
+        cls.author = users[0]
+        groups = [Group.objects.create(title=f'Группа {i}', slug=f'group-{i}',
+                                       description='Описание')
+                  for i in range(GROUPS)]
+        cls.group = groups[0]
+        for i in range(POSTS):
+            Post.objects.create(text=f'Пост {i}', author=users[i % 5],
+                                group=groups[i % GROUPS])
+        cls.post = Post.objects.filter(author=cls.author).first()
+        for i in range(COMMENTS):
+            Comment.objects.create(post=cls.post, author=users[i % USERS],
+                                   text=f'Комментарий {i}')
+        for user in users[1:]:
+            for author in users[:5]:
+                if user != author:
+                    Follow.objects.create(user=user, author=author)
+        cls.reader = users[-1]
+        for author in users[1:5] + [cls.reader]:
+            Follow.objects.create(user=cls.author, author=author)
+
+    def url_kwargs(self, pattern):
+        values = {
+            'slug': self.group.slug,
+            'username': self.reader.username,
+            'post_id': self.post.pk,
+            'uidb64': urlsafe_base64_encode(force_bytes(self.author.pk)),
+            'token': default_token_generator.make_token(self.author),
+        }
+        return {name: values[name] for name in pattern.pattern.converters}
+
+
+class QueryBudgetTest(FeedDataTestCase):
+    def named_urls(self):
+        for module in (posts_urls, users_urls, about_urls):
+            for pattern in module.urlpatterns:
+                if isinstance(pattern, URLPattern) and pattern.name:
+                    name = f'{module.app_name}:{pattern.name}'
+                    yield name, reverse(name, kwargs=self.url_kwargs(pattern))
+
+    def assertWithinBudget(self, name, queries):
+        budget = QUERY_BUDGETS[name]
+        if len(queries) <= budget:
+            return
+        shapes = Counter(_shape(query['sql']) for query in queries)
+        repeated = [f'  x{count}: {shape}'
+                    for shape, count in shapes.items() if count > 1]
+        extra = [f'+ {query["sql"]}' for query in queries[budget:]]
+        self.fail('\n'.join(
+            [f'{name}: {len(queries)} запросов при бюджете {budget}',
+             '--- запросы сверх бюджета'] + extra
+            + ['--- повторяющиеся запросы'] + (repeated or ['  нет'])
+        ))
+
+    def test_every_url_has_budget(self):
+        """У каждого URL приложения есть бюджет запросов"""
+        names = {name for name, url in self.named_urls()}
+        self.assertEqual(names - set(QUERY_BUDGETS), set())
+
+    def test_views_fit_query_budgets(self):
+        """Представления укладываются в бюджет запросов"""
+        for name, url in self.named_urls():
+            with self.subTest(name=name):
+                client = Client()
+                client.force_login(self.author)
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+                self.assertIn(response.status_code,
+                              (HTTPStatus.OK, HTTPStatus.FOUND))
+                self.assertWithinBudget(name, queries.captured_queries)
+
+
+class QueryPlanTest(FeedDataTestCase):
+    def assertIndexed(self, queries):
+        for query in queries:
+            sql = query['sql']
+            if (not sql.startswith('SELECT')
+                    or not any(table in sql for table in FEED_TABLES)):
+                continue
+            with self.subTest(sql=sql):
+                self.assertEqual(plan_problems(sql), [])
+
+    def feed_urls(self):
+        for pattern in posts_urls.urlpatterns:
+            name = f'posts:{pattern.name}'
+            if name in FEED_URLS:
+                yield reverse(name, kwargs=self.url_kwargs(pattern))
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент идут по индексам без полного скана и сортировки"""
+        self.client.force_login(self.author)
+        for url in self.feed_urls():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                page = ('page_obj' if 'page_obj' in response.context
+                        else 'comments')
+                cursor = response.context[page].next_cursor
+                if cursor:
+                    self.client.get(f'{url}?cursor={cursor}')
+                self.client.get(f'{url}?page=2')
+            self.assertIndexed(queries.captured_queries)
+
+    def test_follow_lookups_use_indexes(self):
+        """Подписчики автора и его последние посты ищутся по индексам"""
+        with CaptureQueriesContext(connection) as queries:
+            timeline.fan_out(self.post)
+            timeline.backfill(self.reader.pk, self.author.pk)
+            list(self.author.following.values_list('user_id', flat=True))
+        self.assertIndexed(queries.captured_queries)
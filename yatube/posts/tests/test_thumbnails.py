@@ -0,0 +1,39 @@
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase
+from PIL import Image
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.parsers import parse_geometry
+
+from .. import thumbnail_engine
+
+
+class ThumbnailEngineTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = FileSystemStorage(directory.name)
+        Image.new('RGB', (4000, 3000), 'orange').save(
+            self.storage.path('big.jpg'), 'JPEG')
+        self.options = dict(ThumbnailBackend.default_options, upscale=True)
+
+    def thumbnail(self, engine):
+        image = engine.get_image(ImageFile('big.jpg', self.storage))
+        geometry = parse_geometry('960x339',
+                                  engine.get_image_ratio(image, self.options))
+        thumbnail = engine.create(image, geometry, self.options)
+        return image, thumbnail
+
+    def test_engine_decodes_jpeg_at_reduced_scale(self):
+        """JPEG декодируется в уменьшенном масштабе, а итог не меняется"""
+        engine = thumbnail_engine.Engine()
+        image, thumbnail = self.thumbnail(engine)
+        self.assertEqual(image.size, (500, 375))
+        self.assertEqual(thumbnail.size, (452, 339))
+        engine.write(thumbnail, self.options,
+                     ImageFile('thumb.jpg', self.storage))
+        engine.cleanup(image)
+        self.assertEqual(Image.open(self.storage.path('thumb.jpg')).size,
+                         (452, 339))
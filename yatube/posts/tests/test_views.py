@@ -1,15 +1,34 @@
+import io
+import re
 import shutil
 import tempfile
 
+from hashlib import sha256
 from http import HTTPStatus
+from unittest import mock
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.signals import template_rendered
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
+from PIL import Image
 
-from ..models import Post, Group, Comment, Follow
+from core.storage import is_content_addressed
+from core.db import routers
+from tasks.queue import run_pending
+
+from .. import fragments, thumbnails, timeline, variants
+from ..follows import annotate_follow_state, followed_ids
+from ..utils import NEXT, encode_cursor
+from ..constants import COMMENTS_PER_PAGE
+from ..models import Post, Group, Comment, Follow, PostImageVariant
 
 User = get_user_model()
 
@@ -63,6 +82,7 @@ class PostViewesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(PostViewesTests.user)
@@ -231,8 +251,10 @@ class PostViewesTests(TestCase):
     def test_image_in_page(self):
         """Проверяем. что пост с картинкой создается в БД"""
         self.assertTrue(
-            Post.objects.filter(text="Тестовый текст",
-                                image="posts/small.gif").exists()
+            Post.objects.filter(
+                text="Тестовый текст",
+                image=f'posts/{sha256(self.small_gif).hexdigest()}.gif',
+            ).exists()
         )
 
     def test_comment_correct_context(self):
@@ -257,11 +279,31 @@ class PostViewesTests(TestCase):
         """Проверка кэша на странице index"""
         response = self.authorized_client.get(reverse('posts:index'))
         resp_1 = response.content
-        Post.objects.get(id=1).delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response2 = self.authorized_client.get(reverse('posts:index'))
         resp_2 = response2.content
         self.assertEqual(resp_1, resp_2)
 
+    def test_cache_invalidated_by_signals(self):
+        """Изменение поста сбрасывает кэш ленты"""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.text)
+        Post.objects.get(pk=self.post.pk).delete()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response, self.post.text)
+
+    def test_cache_keyed_on_page_and_auth(self):
+        """Страницы и состояния авторизации кэшируются раздельно"""
+        for i in range(10):
+            Post.objects.create(text=f'Пост {i}', author=self.user2)
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(reverse('posts:index') + '?page=2')
+        self.assertNotEqual(first.content, second.content)
+        self.assertContains(second, self.post.text)
+        authorized = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(authorized, 'Избранные авторы')
+        self.assertNotContains(first, 'Избранные авторы')
+
     def test_follow(self):
         """ Авторизованный пользователь может подписаться"""
         follow_1 = self.user.follower.count()
@@ -314,6 +356,9 @@ class PaginatorViewsTest(TestCase):
                 author=cls.user,
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_ten_records(self):
         """На первой странице index первые 10 постов"""
         response = self.client.get(reverse('posts:index'))
@@ -323,3 +368,746 @@ class PaginatorViewsTest(TestCase):
         """На второй странице index другие 3 поста"""
         response = self.client.get(reverse('posts:index') + '?page=2')
         self.assertEqual(len(response.context['page_obj']), POSTS_P_TWO)
+
+    def test_cursor_pages_follow_each_other(self):
+        """Курсор первой страницы ведёт на оставшиеся посты"""
+        first = self.client.get(reverse('posts:index'))
+        first_page = first.context['page_obj']
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={first_page.next_cursor}'
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), POSTS_P_TWO)
+        self.assertFalse(second_page.has_next())
+        self.assertFalse(set(first_page) & set(second_page))
+
+    def test_cursor_previous_returns_first_page(self):
+        """Курсор «назад» возвращает на предыдущую страницу"""
+        first = self.client.get(reverse('posts:index'))
+        first_page = list(first.context['page_obj'])
+        response = self.client.get(
+            reverse('posts:index')
+            + f'?cursor={first.context["page_obj"].next_cursor}'
+        )
+        response = self.client.get(
+            reverse('posts:index')
+            + f'?cursor={response.context["page_obj"].previous_cursor}'
+        )
+        self.assertEqual(list(response.context['page_obj']), first_page)
+
+    def test_broken_cursor_shows_first_page(self):
+        """Битый курсор показывает первую страницу"""
+        response = self.client.get(reverse('posts:index') + '?cursor=xyz')
+        self.assertEqual(len(response.context['page_obj']), POSTS_P_ONE)
+
+    def test_oversized_cursor_pk_shows_first_page(self):
+        """Курсор с ключом вне диапазона базы показывает первую страницу"""
+        post = Post.objects.first()
+        feed = encode_cursor(NEXT, (post.pub_date, 10 ** 30))
+        pages = {
+            reverse('posts:index'): {'cursor': feed},
+            reverse('posts:profile', args=[self.user.username]):
+                {'cursor': feed},
+            reverse('posts:search'):
+                {'q': 'поста', 'cursor': encode_cursor(NEXT, (-1, 10 ** 30))},
+        }
+        for url, params in pages.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(len(response.context['page_obj']),
+                                 POSTS_P_ONE)
+
+    def test_count_is_cached_until_posts_change(self):
+        """Число постов берётся из кэша, пока посты не изменятся"""
+        cache.clear()
+        self.client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index') + '?page=2')
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql']]
+        )
+        Post.objects.create(text='Ещё один пост', author=self.user)
+        response = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, ALL_POSTS + 1
+        )
+
+    def test_page_links_are_windowed(self):
+        """Ссылки на страницы выводятся окном вокруг текущей"""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.user) for i in range(100)
+        )
+        cache.clear()
+        response = self.client.get(reverse('posts:index') + '?page=6')
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj.page_window), [4, 5, 6, 7, 8])
+        self.assertNotContains(response, '?page=2"')
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Writer')
+        cls.old_post = Post.objects.create(text='Старый пост',
+                                           author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def test_follow_backfills_and_unfollow_drops(self):
+        """Подписка заполняет ленту, отписка её очищает"""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(self.reader.timeline.filter(
+            post=self.old_post).exists())
+        follow.delete()
+        self.assertFalse(self.reader.timeline.exists())
+
+    def test_new_post_is_fanned_out(self):
+        """Новый пост попадает в ленту подписчика"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_timeline_is_capped(self):
+        """Лента обрезается до заданного размера"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        with mock.patch.object(timeline, 'TIMELINE_SIZE', 2):
+            for i in range(3):
+                Post.objects.create(text=f'Пост {i}', author=self.author)
+            self.assertGreater(self.reader.timeline.count(), 2)
+            run_pending()
+        self.assertEqual(self.reader.timeline.count(), 2)
+
+    def test_fan_out_query_count_does_not_grow_with_followers(self):
+        """Раскладка поста не делает запросов на каждого подписчика"""
+        for i in range(5):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'Follower{i}'),
+                author=self.author)
+        post = Post.objects.create(text='Пост', author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            timeline.fan_out(post)
+        self.assertLessEqual(len(queries), 4)
+
+    def test_celebrity_posts_are_merged_on_read(self):
+        """Посты популярного автора подмешиваются при чтении ленты"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        with mock.patch.object(timeline, 'FANOUT_MAX_FOLLOWERS', 0):
+            post = Post.objects.create(text='Пост звезды', author=self.author)
+            self.assertFalse(self.reader.timeline.filter(post=post).exists())
+            response = self.client.get(reverse('posts:follow_index'))
+            self.assertEqual(response.context['page_obj'][0], post)
+            self.assertEqual(
+                response.context['paginator'].count,
+                Post.objects.filter(author=self.author).count())
+            self.assertFalse(self.reader.timeline.filter(post=post).exists())
+            # Чтение ленты не пишет в базу и не прикрепляет к основной.
+            self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+            later = Post.objects.create(text='Ещё пост', author=self.author)
+            response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], later)
+
+
+class CommentsPageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Commentator')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+
+    def add_comments(self, count):
+        start = Comment.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(username=f'user{i}')
+            Comment.objects.create(post=self.post, author=author,
+                                   text=f'Комментарий {i}')
+
+    def count_queries(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_post_detail_query_count_is_constant(self):
+        """Число запросов post_detail не зависит от числа комментариев"""
+        self.add_comments(1)
+        few = self.count_queries()
+        self.add_comments(COMMENTS_PER_PAGE + 5)
+        self.assertEqual(self.count_queries(), few)
+
+    def test_more_comments_fragment(self):
+        """Следующая страница комментариев отдаётся фрагментом"""
+        self.add_comments(COMMENTS_PER_PAGE + 5)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+            + f'?cursor={comments.next_cursor}'
+        )
+        self.assertTemplateUsed(response, 'includes/comment_list.html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertFalse(response.context['comments'].has_next())
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Searcher')
+        cls.match = Post.objects.create(
+            text='Котики и собаки, котики повсюду', author=cls.user)
+        cls.weak_match = Post.objects.create(
+            text='Один котик среди длинного текста о погоде и природе',
+            author=cls.user)
+        cls.other = Post.objects.create(text='Про погоду', author=cls.user)
+
+    def search(self, query, **params):
+        return self.client.get(reverse('posts:search'), {'q': query, **params})
+
+    def test_search_ranks_results(self):
+        """Поиск находит посты и ставит релевантные выше"""
+        response = self.search('котики')
+        self.assertEqual(list(response.context['page_obj']), [self.match])
+        response = self.search('кот')
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.match, self.weak_match])
+
+    def test_search_index_follows_edits(self):
+        """Индекс поиска обновляется при изменении и удалении поста"""
+        self.other.text = 'Теперь про жирафов'
+        self.other.save()
+        self.assertIn(self.other, self.search('жирафов').context['page_obj'])
+        self.assertEqual(len(self.search('погоду').context['page_obj']), 0)
+        self.other.delete()
+        self.assertEqual(len(self.search('жирафов').context['page_obj']), 0)
+
+    def test_search_query_syntax_is_escaped(self):
+        """Спецсимволы FTS в запросе не ломают поиск"""
+        response = self.search('"котики* OR NEAR(')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_search_cursor_pages(self):
+        """Результаты поиска листаются курсором"""
+        Post.objects.bulk_create(
+            Post(text=f'слон номер {i}', author=self.user) for i in range(12)
+        )
+        response = self.search('слон')
+        first = response.context['page_obj']
+        self.assertContains(
+            response, '?q=%D1%81%D0%BB%D0%BE%D0%BD&amp;cursor=')
+        second = self.search('слон', cursor=first.next_cursor)
+        self.assertEqual(len(second.context['page_obj']), 2)
+        self.assertFalse(set(first) & set(second.context['page_obj']))
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через полнотекстовый индекс"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'котики'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertTrue(any('MATCH' in q['sql'] for q in queries))
+
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Painter')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост с картинкой',
+            image=SimpleUploadedFile('thumb.gif', SMALL_GIF,
+                                     content_type='image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def image_src(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        return re.search(r'<img src="([^"]+)" width="960"',
+                         response.content.decode())[1]
+
+    def test_original_shown_until_thumbnail_ready(self):
+        """Пока миниатюры нет, страница показывает исходную картинку"""
+        self.assertEqual(self.image_src(), self.post.image.url)
+        thumbnails.generate(self.post.image.name)
+        self.assertIn('/cache/', self.image_src())
+        self.assertFalse(thumbnails.missing(self.post.image.name))
+
+    def test_upload_schedules_thumbnails(self):
+        """Загрузка картинки ставит её миниатюры в очередь"""
+        with mock.patch('posts.views.schedule_images') as schedule:
+            self.client.post(reverse('posts:post_create'), {
+                'text': 'Новый пост',
+                'image': SimpleUploadedFile(
+                    'new.gif', SMALL_GIF,
+                    content_type='image/gif'),
+            })
+            self.client.post(
+                reverse('posts:post_edit', args=[self.post.pk]),
+                {'text': 'Только текст'})
+        schedule.assert_called_once_with(Post.objects.get(text='Новый пост'))
+
+    def test_backfill_command(self):
+        """Команда создаёт недостающие миниатюры"""
+        call_command('generate_thumbnails', stdout=io.StringIO())
+        self.assertTrue(thumbnails.missing(self.post.image.name))
+        run_pending()
+        self.assertFalse(thumbnails.missing(self.post.image.name))
+        self.assertFalse(variants.missing([self.post.image.name]))
+
+    def test_page_thumbnails_fetched_in_one_query(self):
+        """Миниатюры страницы ищутся одним запросом, а не на каждый пост"""
+        for i in range(3):
+            post = Post.objects.create(
+                author=self.user, text=f'Ещё картинка {i}',
+                image=SimpleUploadedFile(f'more{i}.gif', SMALL_GIF,
+                                         content_type='image/gif'))
+            thumbnails.generate(post.image.name)
+        thumbnails.generate(self.post.image.name)
+        cache.clear()
+        url = reverse('posts:profile', args=[self.user.username])
+        for expected in (1, 0):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            lookups = [q for q in queries if 'thumbnail_kvstore' in q['sql']]
+            self.assertEqual(len(lookups), expected)
+        self.assertEqual(response.content.decode().count('/media/cache/'), 4)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageVariantTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Photographer')
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 500), 'teal').save(buffer, 'JPEG')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Широкая картинка',
+            image=SimpleUploadedFile('wide.jpg', buffer.getvalue(),
+                                     content_type='image/jpeg'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def variants(self):
+        return PostImageVariant.objects.filter(source=self.post.image.name)
+
+    def test_variants_generated_once_per_width_and_format(self):
+        """Варианты создаются для каждой ширины не шире исходной"""
+        with mock.patch.object(variants.Image, 'open',
+                               wraps=variants.Image.open) as image_open:
+            variants.generate(self.post.image.name)
+        self.assertEqual(image_open.call_count, 1)
+        self.assertEqual(
+            sorted(self.variants().values_list('format', 'width')),
+            [(image_format, width) for image_format in ('JPEG', 'WEBP')
+             for width in (320, 640, 960, 1000)],
+        )
+        variant = self.variants().get(format='WEBP', width=320)
+        self.assertEqual(variant.height, 160)
+        self.assertEqual(Image.open(variant.image).format, 'WEBP')
+        self.assertTrue(is_content_addressed(variant.image.name))
+
+    def test_variants_shared_by_posts_with_same_image(self):
+        """Одинаковая картинка кодируется один раз для всех постов"""
+        copy = Post.objects.create(author=self.user, text='Копия',
+                                   image=self.post.image.name)
+        variants.generate(self.post.image.name)
+        with mock.patch.object(variants.Image, 'open') as image_open:
+            variants.generate(copy.image.name)
+        image_open.assert_not_called()
+        self.assertEqual(self.variants().count(), 8)
+        self.assertGreater(Post.objects.get(pk=copy.pk).updated_at,
+                           copy.updated_at)
+        self.assertEqual(variants.for_post(copy), list(self.variants()))
+
+    def test_srcset_rendered(self):
+        """Страницы отдают srcset из вариантов"""
+        variants.generate(self.post.image.name)
+        for url in (reverse('posts:index'),
+                    reverse('posts:post_detail', args=[self.post.pk])):
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.client.get(url)
+                self.assertContains(response, 'type="image/webp"')
+                self.assertContains(response, '.jpg 320w')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Writer')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(title='Группа', slug='cond',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, text='Текст',
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        )
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменившиеся страницы отдают 304 по ETag и Last-Modified"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    self.revalidate(url, response).status_code,
+                    HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+                ).status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_changes_invalidate_validators(self):
+        """Комментарий, подписка и вход меняют ETag своих страниц"""
+        index, group, profile, detail = self.urls
+        changes = (
+            (lambda: Comment.objects.create(post=self.post, text='Новый',
+                                            author=self.reader),
+             (detail,)),
+            (lambda: Follow.objects.create(user=self.reader,
+                                           author=self.author),
+             (profile, detail)),
+            (lambda: self.client.force_login(self.reader), self.urls),
+        )
+        for change, changed in changes:
+            responses = {url: self.client.get(url) for url in self.urls}
+            change()
+            for url, response in responses.items():
+                with self.subTest(url=url):
+                    self.assertEqual(
+                        self.revalidate(url, response).status_code,
+                        HTTPStatus.OK if url in changed
+                        else HTTPStatus.NOT_MODIFIED)
+
+    def test_unrelated_post_keeps_validators(self):
+        """Пост другого автора в другой группе меняет только ленту"""
+        index, group, profile, detail = self.urls
+        other = User.objects.create_user(username='Other')
+        other_group = Group.objects.create(title='Другая', slug='other',
+                                           description='Описание')
+        self.client.force_login(self.reader)
+        responses = {url: self.client.get(url) for url in self.urls}
+        Post.objects.create(author=other, text='Чужой', group=other_group)
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.revalidate(url, response).status_code,
+                    HTTPStatus.OK if url == index
+                    else HTTPStatus.NOT_MODIFIED)
+
+    def test_anonymous_last_modified_not_reused_after_login(self):
+        """Дата ответа анониму не даёт 304 вошедшему пользователю"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.client.logout()
+                response = self.client.get(url)
+                self.client.force_login(self.reader)
+                self.assertEqual(self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+                ).status_code, HTTPStatus.OK)
+
+    def test_relogin_changes_form_page_etag(self):
+        """Повторный вход меняет ETag страницы с формой комментария"""
+        detail = self.urls[-1]
+        reader = User.objects.get(pk=self.reader.pk)
+        reader.set_password('password')
+        reader.save()
+        client = Client()
+        credentials = {'username': reader.username, 'password': 'password'}
+        client.post(reverse('users:login'), credentials)
+        response = client.get(detail)
+        client.post(reverse('users:logout'))
+        client.post(reverse('users:login'), credentials)
+        self.assertEqual(client.get(
+            detail, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            HTTPStatus.OK)
+
+    def test_not_modified_skips_rendering(self):
+        """Ответ 304 не выполняет запросов к постам"""
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.revalidate(url, response)
+        self.assertEqual(len(queries), 0)
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='First')
+        cls.other = User.objects.create_user(username='Second')
+        cls.group = Group.objects.create(title='Первая', slug='first',
+                                         description='Описание')
+        cls.other_group = Group.objects.create(title='Вторая', slug='second',
+                                               description='Описание')
+        cls.post = Post.objects.create(author=cls.author, text='Пост',
+                                       group=cls.group)
+        cls.other_post = Post.objects.create(author=cls.other, text='Другой',
+                                             group=cls.other_group)
+
+    def setUp(self):
+        cache.clear()
+        self.pages = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', args=[self.group.slug]),
+            'profile': reverse('posts:profile', args=[self.author.username]),
+            'detail': reverse('posts:post_detail', args=[self.post.pk]),
+            'other_group': reverse('posts:group_list',
+                                   args=[self.other_group.slug]),
+            'other_profile': reverse('posts:profile',
+                                     args=[self.other.username]),
+            'other_detail': reverse('posts:post_detail',
+                                    args=[self.other_post.pk]),
+        }
+
+    def cached(self):
+        """Страницы, отданные из кэша без запросов к базе."""
+        hits = set()
+        for name, url in self.pages.items():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            if not queries:
+                hits.add(name)
+        return hits
+
+    def test_anonymous_pages_served_from_cache(self):
+        """Повторный анонимный запрос не обращается к базе"""
+        self.assertEqual(self.cached(), set())
+        self.assertEqual(self.cached(), set(self.pages))
+        response = self.client.get(self.pages['index'])
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_post_save_purges_only_its_pages(self):
+        """Правка поста сбрасывает только страницы, где он виден"""
+        self.cached()
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        post.save()
+        self.assertEqual(self.cached(), {'other_group', 'other_profile',
+                                         'other_detail'})
+        response = self.client.get(self.pages['index'])
+        self.assertContains(response, 'Исправленный пост')
+
+    def test_moved_post_purges_old_group(self):
+        """Перенос поста в другую группу сбрасывает обе страницы групп"""
+        self.cached()
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.other_group
+        post.text = 'Переехавший пост'
+        post.save()
+        self.assertEqual(self.cached(), {'other_profile', 'other_detail'})
+        self.assertNotContains(self.client.get(self.pages['group']),
+                               'Переехавший пост')
+        self.assertContains(self.client.get(self.pages['other_group']),
+                            'Переехавший пост')
+
+    def test_logged_in_user_bypasses_cache(self):
+        """Авторизованный пользователь не получает анонимную копию"""
+        self.cached()
+        self.client.force_login(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.pages['index'])
+        self.assertTrue(queries)
+        self.assertContains(response, reverse('users:logout'))
+
+
+class PostFragmentTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Fragment')
+        for i in range(3):
+            Post.objects.create(author=cls.author, text=f'Пост {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        """Разметка постов и id тех из них, что пришлось отрисовать."""
+        rendered = []
+
+        def collect(sender, template, context, **kwargs):
+            if template.name == fragments.TEMPLATE:
+                rendered.append(context['post'].pk)
+
+        template_rendered.connect(collect)
+        try:
+            html = fragments.render_posts(Post.objects.all())
+        finally:
+            template_rendered.disconnect(collect)
+        return html, rendered
+
+    def test_only_changed_posts_rendered(self):
+        """Повторно отрисовываются только изменившиеся посты"""
+        first, rendered = self.render()
+        self.assertEqual(len(rendered), 3)
+        second, rendered = self.render()
+        self.assertEqual(rendered, [])
+        self.assertEqual(first, second)
+        post = Post.objects.first()
+        post.text = 'Исправленный пост'
+        post.save()
+        html, rendered = self.render()
+        self.assertEqual(rendered, [post.pk])
+        self.assertIn('Исправленный пост', html[0])
+        self.assertEqual(html[1:], first[1:])
+
+    def test_rename_rerenders_posts(self):
+        """Переименование автора или группы отрисовывает посты заново"""
+        group = Group.objects.create(title='Группа', slug='old-slug')
+        Post.objects.update(group=group)
+        self.render()
+        group.slug = 'new-slug'
+        group.save()
+        html, rendered = self.render()
+        self.assertEqual(len(rendered), 3)
+        self.assertIn('/group/new-slug/', html[0])
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'Renamed'
+        author.save()
+        html, rendered = self.render()
+        self.assertEqual(len(rendered), 3)
+        self.assertIn('/profile/Renamed/', html[0])
+
+    def test_feed_assembled_from_fragments(self):
+        """Лента при повторном запросе не отрисовывает посты заново"""
+        self.client.force_login(self.author)
+        url = reverse('posts:profile', args=[self.author.username])
+        self.assertTemplateUsed(self.client.get(url), fragments.TEMPLATE)
+        response = self.client.get(url)
+        self.assertTemplateNotUsed(response, fragments.TEMPLATE)
+        self.assertContains(response, 'Пост 2')
+
+
+class FollowStateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.followed = User.objects.create_user(username='Followed')
+        cls.other = User.objects.create_user(username='Other')
+        Follow.objects.create(user=cls.reader, author=cls.followed)
+        Follow.objects.create(user=cls.other, author=cls.other)
+        for author in (cls.followed, cls.other):
+            for i in range(3):
+                Post.objects.create(author=author, text=f'Пост {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.reader
+
+    def state(self, objects):
+        return {obj.pk: obj.is_followed_by_request_user for obj in objects}
+
+    def test_list_annotated_in_one_query(self):
+        """Список постов и пользователей размечается одним запросом"""
+        posts = list(Post.objects.all())
+        users = list(User.objects.all())
+        with self.assertNumQueries(1):
+            annotate_follow_state(self.request, posts)
+            annotate_follow_state(self.request, users)
+        for post in posts:
+            self.assertEqual(post.is_followed_by_request_user,
+                             post.author_id == self.followed.pk)
+        self.assertEqual(self.state(users), {
+            self.reader.pk: False, self.followed.pk: True,
+            self.other.pk: False,
+        })
+
+    def test_queryset_annotated_without_extra_queries(self):
+        """Выборка размечается в том же запросе"""
+        with self.assertNumQueries(1):
+            users = self.state(annotate_follow_state(self.request,
+                                                     User.objects.all()))
+        self.assertEqual(users[self.followed.pk], True)
+        self.assertEqual(users[self.other.pk], False)
+        with self.assertNumQueries(1):
+            posts = list(annotate_follow_state(self.request,
+                                               Post.objects.all()))
+        for post in posts:
+            self.assertEqual(post.is_followed_by_request_user,
+                             post.author_id == self.followed.pk)
+
+    def test_followed_ids_memoized(self):
+        """Подписки читаются один раз за запрос"""
+        with self.assertNumQueries(1):
+            self.assertEqual(followed_ids(self.request), {self.followed.pk})
+            followed_ids(self.request)
+
+    def test_anonymous_follows_nobody(self):
+        """Аноним ни на кого не подписан и запросов не делает"""
+        self.request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            posts = annotate_follow_state(self.request,
+                                          list(Post.objects.none()))
+            users = annotate_follow_state(self.request, User.objects.all())
+        self.assertEqual(posts, [])
+        self.assertFalse(any(self.state(users).values()))
+
+    def test_profile_following_is_for_request_user(self):
+        """Профиль показывает подписку текущего пользователя"""
+        self.client.force_login(self.reader)
+        for author, following in ((self.followed, True), (self.other, False)):
+            with self.subTest(author=author.username):
+                response = self.client.get(
+                    reverse('posts:profile', args=[author.username]))
+                self.assertIs(response.context['following'], following)
+
+    def test_index_shows_follow_buttons(self):
+        """В ленте у чужих постов есть кнопки подписки и отписки"""
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response, reverse('posts:profile_unfollow',
+                              args=[self.followed.username]), count=3)
+        self.assertContains(
+            response, reverse('posts:profile_follow',
+                              args=[self.other.username]), count=3)
+        self.client.get(reverse('posts:profile_follow',
+                                args=[self.other.username]))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response, reverse('posts:profile_unfollow',
+                              args=[self.other.username]), count=3)
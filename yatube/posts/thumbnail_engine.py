@@ -0,0 +1,86 @@
+"""
+Движок sorl-thumbnail, который уменьшает картинку ещё при декодировании.
+
+JPEG декодируется сразу в уменьшенном масштабе (draft: DCT-масштабирование
+на 1/2, 1/4 или 1/8), затем картинка сжимается reduce() в целое число раз,
+и только остаток масштабирования делается дорогим ресемплингом. Исходный
+файл читается из хранилища потоком, а результат пишется во временный файл
+и сохраняется в хранилище без промежуточной копии в памяти.
+"""
+import math
+import tempfile
+
+from django.core.files import File
+from PIL import Image
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.engines.pil_engine import Engine as PILEngine
+
+# Во сколько раз картинка после reduce() должна остаться больше итоговой,
+# чтобы ресемплинг сгладил ступеньки от целочисленного сжатия.
+REDUCING_GAP = 2
+# Результат больше этого размера пишется на диск, а не держится в памяти.
+SPOOL_SIZE = 1024 * 1024
+
+
+class Engine(PILEngine):
+    def get_image(self, source):
+        file = source.storage.open(source.name)
+        image = Image.open(file)
+        image.source_file = file
+        return image
+
+    def cleanup(self, image):
+        image.close()
+        if hasattr(image, 'source_file'):
+            image.source_file.close()
+
+    def create(self, image, geometry, options):
+        self.draft(image, geometry, options)
+        return super().create(image, geometry, options)
+
+    def draft(self, image, geometry, options):
+        """Просит декодер JPEG отдать картинку не крупнее нужного."""
+        if image.format != 'JPEG' or options.get('cropbox'):
+            return
+        x_image, y_image = image.size
+        flip = self.flip_dimensions(image)
+        if flip:
+            x_image, y_image = y_image, x_image
+        factor = self._calculate_scaling_factor(x_image, y_image, geometry,
+                                                options)
+        # Альтернативные разрешения создаются из той же картинки.
+        factor *= max(settings.THUMBNAIL_ALTERNATIVE_RESOLUTIONS or [1])
+        if factor >= 1:
+            return
+        size = (math.ceil(x_image * factor), math.ceil(y_image * factor))
+        if flip:
+            size = size[::-1]
+        image.draft(image.mode, size)
+
+    def _scale(self, image, width, height):
+        factor = min(image.width // (width * REDUCING_GAP),
+                     image.height // (height * REDUCING_GAP))
+        if factor > 1:
+            image = image.reduce(factor)
+        return image.resize((width, height), resample=Image.LANCZOS)
+
+    def write(self, image, options, thumbnail):
+        params = {'format': options['format'], 'quality': options['quality'],
+                  'optimize': True}
+        icc_profile = options.get('image_info', {}).get('icc_profile')
+        if icc_profile:
+            params['icc_profile'] = icc_profile
+        if params['format'] == 'JPEG' and options.get(
+                'progressive', settings.THUMBNAIL_PROGRESSIVE):
+            params['progressive'] = True
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as buffer:
+            try:
+                image.save(buffer, **params)
+            except OSError:
+                # Как и в sorl: без optimize кодировщику хватает буфера.
+                del params['optimize']
+                buffer.seek(0)
+                buffer.truncate()
+                image.save(buffer, **params)
+            buffer.seek(0)
+            thumbnail.write(File(buffer, name=thumbnail.name))
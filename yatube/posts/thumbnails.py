@@ -0,0 +1,131 @@
+"""
+Заблаговременная генерация миниатюр картинок постов.
+
+Миниатюры создают обработчики очереди задач tasks после коммита
+транзакции, в которой сохранили картинку. Шаблоны только ищут готовую
+миниатюру и, пока её нет, показывают исходную картинку, так что запрос
+никогда не ждёт Pillow.
+"""
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from tasks.queue import enqueue
+
+from .caching import FEED_NAMESPACE, bump_version, purge_posts
+from .constants import POST_THUMBNAILS
+from .models import Post
+
+
+class LookupBackend(ThumbnailBackend):
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, который создал бы get_thumbnail."""
+        source = ImageFile(file_)
+        # Параметры дополняются так же, как в get_thumbnail, иначе имя
+        # миниатюры не совпадёт с созданным генератором.
+        if settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup_many(self, files, geometry_string, **options):
+        """
+        Готовые миниатюры картинок за один get_many к кэшу и не больше
+        одного запроса к базе; для ещё не созданных — None.
+        """
+        thumbnails = [self.thumbnail_file(file_, geometry_string, **options)
+                      for file_ in files]
+        kvstore = default.kvstore
+        if not isinstance(kvstore, CachedDBStore):
+            return [kvstore.get(thumbnail) for thumbnail in thumbnails]
+        keys = [add_prefix(thumbnail.key) for thumbnail in thumbnails]
+        values = {key: value
+                  for key, value in kvstore.cache.get_many(keys).items()
+                  if value != EMPTY_VALUE}
+        missing = [key for key in keys if key not in values]
+        if missing:
+            # В отличие от sorl, отсутствие записи не кэшируем: миниатюру
+            # создаёт другой процесс, и страница должна её увидеть.
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            kvstore.cache.set_many(found, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(found)
+        return [deserialize_image_file(values[key]) if key in values
+                else None for key in keys]
+
+
+backend = LookupBackend()
+
+
+def _prefetch_key(geometry_string, options):
+    return geometry_string, tuple(sorted(options.items()))
+
+
+def ready(file_, geometry_string, **options):
+    if not file_:
+        return None
+    prefetched = getattr(file_, 'prefetched_thumbnails', {})
+    key = _prefetch_key(geometry_string, options)
+    if key in prefetched:
+        return prefetched[key]
+    return backend.lookup_many([file_], geometry_string, **options)[0]
+
+
+def prefetch(posts):
+    """
+    Разом находит готовые миниатюры картинок постов страницы.
+
+    Результаты сохраняются на post.image, и ready берёт их оттуда вместо
+    отдельного обращения к хранилищу ключей на каждую картинку.
+    """
+    images = [post.image for post in posts if post.image]
+    if not images:
+        return
+    for geometry, options in POST_THUMBNAILS:
+        key = _prefetch_key(geometry, options)
+        found = backend.lookup_many(images, geometry, **options)
+        for image, thumbnail in zip(images, found):
+            if not hasattr(image, 'prefetched_thumbnails'):
+                image.prefetched_thumbnails = {}
+            image.prefetched_thumbnails[key] = thumbnail
+
+
+def source(name):
+    """Картинка поста по имени, в хранилище поля Post.image."""
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def missing(name):
+    """Есть ли у картинки миниатюры, которые ещё не созданы."""
+    return any(ready(source(name), geometry, **options) is None
+               for geometry, options in POST_THUMBNAILS)
+
+
+def generate(name):
+    """Создаёт все миниатюры картинки поста."""
+    for geometry, options in POST_THUMBNAILS:
+        default.backend.get_thumbnail(source(name), geometry, **options)
+    # Закэшированные ленты ещё ссылаются на исходную картинку.
+    posts = Post.objects.filter(image=name)
+    posts.update(updated_at=timezone.now())
+    bump_version(FEED_NAMESPACE)
+    purge_posts(posts)
+    return name
+
+
+def schedule(name):
+    """Ставит генерацию миниатюр картинки в очередь задач."""
+    enqueue(generate, name)
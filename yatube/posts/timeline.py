@@ -0,0 +1,142 @@
+"""
+Материализованная лента подписок.
+
+Новый пост раскладывается по лентам подписчиков автора при создании
+(fan-out on write), поэтому страница подписок читает одну таблицу
+по индексу (user, pub_date). Посты авторов с очень большим числом
+подписчиков не раскладываются: они подмешиваются в ленту читателя
+запросом при её просмотре. Лента каждого пользователя ограничена
+TIMELINE_SIZE записями; обрезку после раскладки выполняет очередь задач.
+"""
+from django.db import connection
+from django.db.models import Q
+
+from tasks.queue import enqueue
+
+from .constants import FANOUT_MAX_FOLLOWERS, TIMELINE_SIZE
+from .models import Follow, Post, TimelineEntry, UserCounter
+
+BATCH_SIZE = 500
+
+
+def _add_entries(user_id, posts):
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _latest_posts(author_ids):
+    return Post.objects.filter(author_id__in=author_ids).values_list(
+        'pk', 'pub_date')[:TIMELINE_SIZE]
+
+
+def celebrity_ids(author_ids):
+    """Авторы из списка, чьи посты не раскладываются по лентам."""
+    return list(UserCounter.objects.filter(
+        user_id__in=author_ids,
+        followers_count__gt=FANOUT_MAX_FOLLOWERS,
+    ).values_list('user_id', flat=True))
+
+
+def prune(user_id):
+    """Обрезает ленту пользователя до TIMELINE_SIZE последних записей."""
+    stale = (TimelineEntry.objects.filter(user_id=user_id)
+             .values('pk')[TIMELINE_SIZE:])
+    TimelineEntry.objects.filter(pk__in=stale).delete()
+
+
+def prune_followers(author_id):
+    """
+    Обрезает ленты подписчиков автора одним DELETE.
+
+    Записи нумеруются оконной функцией только в лентах, где есть запись
+    за пределом TIMELINE_SIZE, так что короткие ленты не читаются.
+    """
+    table = TimelineEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN ('
+            f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+            f'PARTITION BY user_id ORDER BY pub_date DESC, id DESC'
+            f') AS position FROM {table} WHERE user_id IN ('
+            f'SELECT user_id FROM {Follow._meta.db_table} AS follow '
+            f'WHERE author_id = %s AND EXISTS ('
+            f'SELECT 1 FROM {table} AS entry '
+            f'WHERE entry.user_id = follow.user_id LIMIT 1 OFFSET %s))'
+            f') AS ranked WHERE position > %s)',
+            [author_id, TIMELINE_SIZE, TIMELINE_SIZE],
+        )
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков его автора."""
+    if post.author_id is None or celebrity_ids([post.author_id]):
+        return
+    user_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post.pk,
+                       pub_date=post.pub_date)
+         for user_id in user_ids.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    enqueue(prune_followers, post.author_id)
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту последними постами автора после подписки."""
+    _add_entries(user_id, _latest_posts([author_id]))
+    prune(user_id)
+
+
+def drop(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild(user_id):
+    """
+    Строит ленту пользователя заново по текущим подпискам.
+
+    Записи копируются одним INSERT ... SELECT, без выгрузки постов
+    в Python: так ленты после массовой загрузки данных собираются
+    за разумное время.
+    """
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            f'(user_id, post_id, pub_date) '
+            f'SELECT %s, id, pub_date FROM {Post._meta.db_table} '
+            f'WHERE author_id IN (SELECT author_id FROM '
+            f'{Follow._meta.db_table} WHERE user_id = %s) '
+            f'ORDER BY pub_date DESC, id DESC LIMIT %s',
+            [user_id, user_id, TIMELINE_SIZE],
+        )
+
+
+def timeline(user_id):
+    """
+    Лента подписок пользователя, от новых записей к старым.
+
+    Обычно это записи TimelineEntry. Если пользователь подписан на
+    популярных авторов, лента — выборка постов: записи его ленты вместе
+    с последними постами этих авторов. Чтение ленты ничего не пишет.
+    """
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    celebrities = celebrity_ids(Follow.objects.filter(
+        user_id=user_id).values_list('author_id', flat=True))
+    if not celebrities:
+        return entries.select_related('post__author', 'post__group')
+    latest = Post.objects.filter(
+        author_id__in=celebrities).values('pk')[:TIMELINE_SIZE]
+    return Post.objects.filter(
+        Q(pk__in=entries.values('post_id')) | Q(pk__in=latest)
+    ).select_related('author', 'group')
@@ -0,0 +1,77 @@
+"""
+Обработка загружаемых картинок постов.
+
+Размер картинки проверяется по заголовку, до декодирования пикселей, так
+что «бомба декомпрессии» отклоняется сразу. Затем картинка уменьшается до
+UPLOAD_MAX_SIZE, поворачивается по EXIF и перекодируется без метаданных.
+Крупный результат пишется во временный файл, а не держится в памяти.
+"""
+import os
+import tempfile
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image, ImageOps, features
+
+from .constants import (UPLOAD_FORMAT, UPLOAD_MAX_PIXELS, UPLOAD_MAX_SIZE,
+                        UPLOAD_QUALITY)
+
+CONTENT_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def output_format():
+    if UPLOAD_FORMAT == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return UPLOAD_FORMAT
+
+
+def open_checked(upload):
+    """Открывает картинку, отклоняя слишком большие по числу пикселей."""
+    upload.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(upload)
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        image = None
+    if image is None or image.width * image.height > UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: не больше %(pixels)d Мп.',
+            code='too_many_pixels',
+            params={'pixels': UPLOAD_MAX_PIXELS // 1000000},
+        )
+    return image
+
+
+def process(upload):
+    """Перекодированная картинка для сохранения вместо загруженной."""
+    image = open_checked(upload)
+    image_format = output_format()
+    with image:
+        # thumbnail() сам просит декодер JPEG об уменьшенном масштабе.
+        image.thumbnail(UPLOAD_MAX_SIZE, Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha and image_format != 'JPEG':
+        image = image.convert('RGBA')
+    else:
+        image = image.convert('RGB')
+    buffer = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR,
+    )
+    params = {'quality': UPLOAD_QUALITY}
+    if image_format == 'JPEG':
+        params.update(optimize=True, progressive=True)
+    image.save(buffer, image_format, **params)
+    size = buffer.tell()
+    buffer.seek(0)
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    return InMemoryUploadedFile(
+        buffer, 'image', f'{stem}.{EXTENSIONS[image_format]}',
+        CONTENT_TYPES[image_format], size, None,
+    )
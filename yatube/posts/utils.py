@@ -1,13 +1,220 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property, lazy
+
+from .caching import get_version
+from .constants import COMMENTS_PER_PAGE, COUNT_CACHE_TIMEOUT, PAGE_WINDOW
 from .constants import PER_PAGE as yatube_PER_PAGE
 
+NEXT = 'n'
+PREVIOUS = 'p'
+COUNT_NAMESPACE = 'count'
+# Первичные ключи в курсоре ограничены знаковым 64-битным целым,
+# которое принимает база; больший ключ — признак поддельного курсора.
+MAX_PK = 2 ** 63 - 1
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключа в непрозрачный токен."""
+    raw = json.dumps([direction] + [str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, для битого токена возвращает None."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, *values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if direction not in (NEXT, PREVIOUS):
+        return None
+    return direction, values
+
+
+class CursorPage:
+    """Страница выборки, полученная по курсору, а не по номеру."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __contains__(self, item):
+        return item in self.object_list
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _cursor_key(obj, field):
+    return getattr(obj, field), obj.pk
+
 
-def page_numbers(queryset, request):
-    paginator = Paginator(queryset, yatube_PER_PAGE)
+def parse_pk(value):
+    """Первичный ключ из курсора; вне диапазона базы — ValueError."""
+    pk = int(value)
+    if not 0 < pk <= MAX_PK:
+        raise ValueError('Первичный ключ курсора вне диапазона')
+    return pk
+
+
+def _parse_key(values, field_type):
+    value, pk = values
+    if field_type == 'DateTimeField':
+        value = parse_datetime(value)
+        if value is None:
+            raise ValueError('Некорректная дата в курсоре')
+    return value, parse_pk(pk)
+
+
+def cursor_paginate(queryset, cursor=None, per_page=yatube_PER_PAGE,
+                    ordering='-pub_date'):
+    """
+    Keyset-пагинация по паре (ordering, pk).
+
+    Вместо OFFSET страница выбирается условием «строго после ключа
+    последнего показанного объекта», поэтому глубина страницы не влияет
+    на стоимость запроса при наличии индекса по (поле, id).
+    """
+    descending = ordering.startswith('-')
+    field = ordering.lstrip('-')
+    field_type = queryset.model._meta.get_field(field).get_internal_type()
+    decoded = decode_cursor(cursor) if cursor else None
+    key = None
+    if decoded is not None:
+        try:
+            key = _parse_key(decoded[1], field_type)
+        except (OverflowError, TypeError, ValueError):
+            key = None
+    direction = decoded[0] if key is not None else NEXT
+    forward = direction == NEXT
+    ascending = forward != descending
+    order = ('' if ascending else '-')
+    queryset = queryset.order_by(f'{order}{field}', f'{order}pk')
+    if key is not None:
+        lookup = 'gt' if ascending else 'lt'
+        queryset = queryset.filter(
+            **{f'{field}__{lookup}e': key[0]}
+        ).filter(
+            Q(**{f'{field}__{lookup}': key[0]})
+            | Q(**{field: key[0], f'pk__{lookup}': key[1]})
+        )
+    rows = list(queryset[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or not forward:
+            next_cursor = encode_cursor(NEXT, _cursor_key(rows[-1], field))
+        if key is not None and (forward or has_more):
+            previous_cursor = encode_cursor(
+                PREVIOUS, _cursor_key(rows[0], field)
+            )
+    return CursorPage(rows, next_cursor, previous_cursor)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Пагинатор, который не выполняет COUNT(*) на каждый запрос.
+
+    Число объектов берётся из кэша по ключу, построенному из SQL выборки,
+    и пересчитывается только после сохранения или удаления постов и
+    подписок. Ссылки на страницы выводятся окном вокруг текущей.
+    """
+
+    window = PAGE_WINDOW
+
+    @cached_property
+    def count(self):
+        sql, params = self.object_list.query.sql_with_params()
+        digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        key = f'posts:count:{get_version(COUNT_NAMESPACE)}:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        first = max(page.number - self.window, 1)
+        last = min(page.number + self.window, self.num_pages)
+        page.page_window = range(first, last + 1)
+        return page
+
+
+def _next_cursor(page_obj, field='pub_date'):
+    if not page_obj.has_next():
+        return ''
+    last = page_obj.object_list[len(page_obj.object_list) - 1]
+    return encode_cursor(NEXT, _cursor_key(last, field))
+
+
+def page_numbers(queryset, request, transform=None):
+    """
+    Контекст пагинации ленты.
+
+    transform превращает объекты страницы в то, что выводит шаблон
+    (например, записи ленты в посты); курсоры при этом строятся
+    по исходным объектам.
+    """
+    cursor = request.GET.get('cursor')
+    if cursor:
+        page_obj = cursor_paginate(queryset, cursor)
+        if transform is not None:
+            page_obj.object_list = transform(page_obj.object_list)
+        return {
+            'paginator': None,
+            'page_number': None,
+            'page_obj': page_obj,
+        }
+    paginator = CachedCountPaginator(queryset, yatube_PER_PAGE)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    if transform is not None:
+        page_obj.next_cursor = _next_cursor(page_obj)
+        page_obj.object_list = transform(page_obj.object_list)
+    else:
+        # Курсор считается лениво: при попадании во фрагментный кэш
+        # шаблона выборка страницы так и не выполняется.
+        page_obj.next_cursor = lazy(_next_cursor, str)(page_obj)
     return {
         'paginator': paginator,
         'page_number': page_number,
         'page_obj': page_obj,
     }
+
+
+def comments_page(post, request):
+    """Страница комментариев поста, от старых к новым."""
+    return cursor_paginate(
+        post.comments.select_related('author'),
+        request.GET.get('cursor'),
+        COMMENTS_PER_PAGE,
+        ordering='created',
+    )
@@ -0,0 +1,116 @@
+"""
+Адаптивные варианты картинок постов.
+
+Картинка декодируется один раз, и из неё получаются копии всех ширин
+IMAGE_VARIANT_WIDTHS в каждом формате IMAGE_VARIANT_FORMATS. Варианты
+создаются один раз на содержимое картинки, сколько бы постов её ни
+использовали. Шаблоны собирают из записей PostImageVariant атрибуты
+srcset.
+"""
+import io
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from tasks.queue import enqueue
+
+from . import thumbnails
+from .caching import FEED_NAMESPACE, bump_version, purge_posts
+from .constants import (IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY,
+                        IMAGE_VARIANT_WIDTHS)
+from .models import Post, PostImageVariant
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def target_widths(width):
+    """Ширины вариантов: не шире исходной картинки."""
+    widths = [target for target in IMAGE_VARIANT_WIDTHS if target < width]
+    if width <= IMAGE_VARIANT_WIDTHS[-1]:
+        widths.append(width)
+    return widths
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=IMAGE_VARIANT_QUALITY,
+               optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def render(name):
+    """Несохранённые варианты картинки с именем name."""
+    storage = Post._meta.get_field('image').storage
+    with storage.open(name, 'rb') as file:
+        with Image.open(file) as image:
+            source = ImageOps.exif_transpose(image).convert('RGB')
+    variants = []
+    for width in target_widths(source.width):
+        height = max(round(source.height * width / source.width), 1)
+        resized = source.resize((width, height), Image.LANCZOS)
+        for image_format in IMAGE_VARIANT_FORMATS:
+            variant = PostImageVariant(source=name, format=image_format,
+                                       width=width, height=height)
+            # Хранилище назовёт файл по хешу его собственных байтов.
+            variant.image.save(f'{width}w.{EXTENSIONS[image_format]}',
+                               encode(resized, image_format), save=False)
+            variants.append(variant)
+    return variants
+
+
+def generate(name):
+    """
+    Создаёт варианты картинки, если их ещё нет.
+
+    Имя картинки — хеш содержимого, поэтому готовые варианты не
+    устаревают и общие для всех постов с этой картинкой.
+    """
+    if not name or PostImageVariant.objects.filter(source=name).exists():
+        return name
+    PostImageVariant.objects.bulk_create(render(name), ignore_conflicts=True)
+    posts = Post.objects.filter(image=name)
+    posts.update(updated_at=timezone.now())
+    bump_version(FEED_NAMESPACE)
+    purge_posts(posts)
+    return name
+
+
+def missing(names):
+    """Имена из списка, у которых ещё нет вариантов."""
+    done = set(PostImageVariant.objects.filter(
+        source__in=names).values_list('source', flat=True))
+    return [name for name in names if name not in done]
+
+
+def schedule(post):
+    """Ставит в очередь генерацию миниатюр и вариантов картинки поста."""
+    if post.image:
+        thumbnails.schedule(post.image.name)
+        enqueue(generate, post.image.name)
+
+
+def for_post(post):
+    if not hasattr(post, 'prefetched_variants'):
+        post.prefetched_variants = (
+            list(PostImageVariant.objects.filter(source=post.image.name))
+            if post.image else [])
+    return post.prefetched_variants
+
+
+def prefetch(posts):
+    """Загружает варианты картинок всех постов страницы одним запросом."""
+    posts = [post for post in posts if post.image]
+    if not posts:
+        return
+    found = {post.image.name: [] for post in posts}
+    for variant in PostImageVariant.objects.filter(source__in=found):
+        found[variant.source].append(variant)
+    for post in posts:
+        post.prefetched_variants = found[post.image.name]
+
+
+def srcset(post, image_format):
+    return ', '.join(f'{variant.image.url} {variant.width}w'
+                     for variant in for_post(post)
+                     if variant.format == image_format)
@@ -1,55 +1,100 @@
+from urllib.parse import urlencode
+
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Post, Group, User, Comment, Follow
-from .utils import page_numbers
+
+from core.pagecache import tag_page
+from .models import Post, Group, User, Follow, TimelineEntry
+from .caching import feed_cache_context
+from .conditional import (conditional_page, group_tags, index_tags,
+                          post_detail_tags, profile_tags)
+from .follows import annotate_follow_state
+from .search import search_page
+from .utils import comments_page, page_numbers
+from .timeline import timeline
+from .variants import schedule as schedule_images
 from django.contrib.auth.decorators import login_required
 from .forms import PostForm, CommentForm
 
 
+@conditional_page(index_tags)
 def index(request):
+    tag_page(request, 'index')
     context = page_numbers(Post.objects
                            .select_related('group', 'author'),
                            request)
+    context.update(feed_cache_context(request, 'index'))
     return render(request, 'posts/index.html',
                   context)
 
 
+@conditional_page(group_tags)
 def group_posts(request, slug):
+    tag_page(request)
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    tag_page(request, f'group:{group.pk}')
+    posts = group.posts.select_related('author')
     context = {
         'group': group,
         'posts': posts,
     }
-    context.update(page_numbers(group.posts.all(), request))
+    context.update(page_numbers(posts, request))
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_tags)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    following = author.following.exists()
+    tag_page(request)
+    author = get_object_or_404(
+        annotate_follow_state(request, User.objects.select_related('counter')),
+        username=username,
+    )
+    tag_page(request, f'profile:{author.pk}')
+    posts = author.posts.select_related('group')
 
     context = {
         'author': author,
         'posts': posts,
-        'following': following
+        'following': author.is_followed_by_request_user,
     }
     context.update(page_numbers(posts, request))
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': search_page(query, request.GET.get('cursor')),
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@conditional_page(post_detail_tags)
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post)
+    tag_page(request, f'post:{post_id}')
+    post = get_object_or_404(
+        Post.objects.select_related('author__counter', 'group'), pk=post_id
+    )
+    tag_page(request, f'profile:{post.author_id}')
     context = {
         'post': post,
         'form': form,
-        'comments': comments,
+        'comments': comments_page(post, request),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': comments_page(post, request),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -58,6 +103,8 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    if post.image:
+        schedule_images(post)
     return redirect('posts:profile', request.user)
 
 
@@ -71,6 +118,8 @@ def post_edit(request, post_id):
                     instance=post)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            schedule_images(post)
         return redirect('posts:post_detail', post_id=post.pk)
     else:
         return render(request, 'posts/post_create.html', {'is_edit': True,
@@ -92,11 +141,14 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    follower = Follow.objects.filter(user=request.user).values_list(
-        'author_id', flat=True
+    feed = timeline(request.user.pk)
+    context = page_numbers(
+        feed,
+        request,
+        transform=(lambda entries: [entry.post for entry in entries])
+        if feed.model is TimelineEntry else None,
     )
-    posts = Post.objects.filter(author_id__in=follower)
-    context = page_numbers(posts, request)
+    context.update(feed_cache_context(request, 'follow'))
     return render(request, 'posts/follow.html', context)
 
 
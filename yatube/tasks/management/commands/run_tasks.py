@@ -0,0 +1,39 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+from tasks.queue import LEASE
+from tasks.worker import process_main, work
+
+
+class Command(BaseCommand):
+    help = 'Запускает обработчики фоновых задач из очереди в базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--lease', type=int, default=LEASE,
+                            help='Секунд на задачу, после которых её '
+                                 'заберёт другой обработчик')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Пауза, когда очередь пуста, в секундах')
+        parser.add_argument('--burst', action='store_true',
+                            help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        params = (options['lease'], options['poll'], options['burst'])
+        if options['processes'] <= 1:
+            work(*params)
+            return
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=process_main, args=params)
+                     for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from tasks import queue
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Показывает глубину очереди фоновых задач и последние ошибки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--errors', type=int, default=5,
+                            help='Сколько последних упавших задач показать')
+        parser.add_argument('--prune-days', type=int,
+                            help='Удалить выполненные задачи старше N дней')
+
+    def handle(self, *args, **options):
+        if options['prune_days'] is not None:
+            pruned = queue.prune(options['prune_days'])
+            self.stdout.write(f'Удалено выполненных задач: {pruned}')
+        stats = queue.stats()
+        for status, title in Task.STATUSES:
+            self.stdout.write(f'{title:<18}{stats["counts"][status]:>8}')
+        self.stdout.write(f'{"Готовы к запуску":<18}{stats["due"]:>8}')
+        if stats['oldest_queued_age'] is not None:
+            self.stdout.write(
+                f'Самая старая задача ждёт {stats["oldest_queued_age"]:.0f} с')
+        failed = Task.objects.filter(
+            status=Task.FAILED).order_by('-finished')[:options['errors']]
+        for task in failed:
+            error = task.last_error.strip().splitlines()[-1:]
+            self.stdout.write(self.style.ERROR(
+                f'#{task.pk} {task.name}: {"".join(error)}'))
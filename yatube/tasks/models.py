@@ -0,0 +1,40 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """Фоновая задача: вызов функции по пути импорта с JSON-аргументами."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Не удалась'),
+    )
+
+    name = models.CharField('Функция', max_length=200)
+    args = models.TextField('Аргументы', default='[]')
+    status = models.CharField('Статус', max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Наибольшее число попыток',
+                                                    default=5)
+    run_after = models.DateTimeField('Выполнить после', default=timezone.now)
+    locked_by = models.CharField('Обработчик', max_length=100, blank=True)
+    locked_until = models.DateTimeField('Аренда до', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='task_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} [{self.get_status_display()}]'
@@ -0,0 +1,143 @@
+"""
+Очередь фоновых задач в таблице базы данных.
+
+Задача ставится в очередь записью в текущей транзакции: обработчики
+увидят её только после коммита, а при откате она исчезнет вместе
+с остальными изменениями, как если бы её поставили из on_commit, но без
+окна, в котором коммит прошёл, а задача потерялась.
+
+Обработчик забирает задачу условным UPDATE и получает её в аренду.
+Если он умер, не закончив, аренда истекает и задачу забирает другой.
+Упавшая задача повторяется с экспоненциальной задержкой, пока не
+кончатся попытки. Попытки тратит и истёкшая аренда: задача, которая
+роняет сам обработчик, после последней попытки помечается неудавшейся.
+"""
+import json
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+from .worker import LEASE
+MAX_BACKOFF = 60 * 60
+
+
+def task_name(function):
+    name = f'{function.__module__}.{function.__qualname__}'
+    if '<' in name or import_string(name) is not function:
+        raise ValueError(f'{name} нельзя импортировать по имени')
+    return name
+
+
+def enqueue(function, *args, delay=0, max_attempts=5):
+    """Ставит вызов function(*args) в очередь; аргументы — JSON."""
+    return Task.objects.create(
+        name=task_name(function),
+        args=json.dumps(args),
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def due(now):
+    """Задачи, которые можно забрать: ждущие и с истёкшей арендой."""
+    return Task.objects.filter(
+        Q(status=Task.QUEUED, run_after__lte=now)
+        | Q(status=Task.RUNNING, locked_until__lt=now,
+            attempts__lt=F('max_attempts'))
+    )
+
+
+def expire(now):
+    """Помечает неудавшимися задачи, истратившие попытки на аренды."""
+    return Task.objects.filter(
+        status=Task.RUNNING, locked_until__lt=now,
+        attempts__gte=F('max_attempts'),
+    ).update(status=Task.FAILED, finished=now,
+             last_error='Аренда истекла после последней попытки')
+
+
+def claim(worker, lease=LEASE):
+    """Забирает в аренду ближайшую задачу или возвращает None."""
+    now = timezone.now()
+    expire(now)
+    for pk in due(now).values_list('pk', flat=True)[:10]:
+        # Условный UPDATE атомарен: из нескольких обработчиков задачу
+        # получит ровно тот, чей запрос первым изменит строку.
+        claimed = due(now).filter(pk=pk).update(
+            status=Task.RUNNING, locked_by=worker,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def backoff(attempts):
+    return min(2 ** attempts, MAX_BACKOFF)
+
+
+def run(task):
+    """Выполняет задачу и записывает итог, если аренда ещё за нами."""
+    mine = Task.objects.filter(pk=task.pk, locked_by=task.locked_by,
+                               status=Task.RUNNING)
+    try:
+        import_string(task.name)(*json.loads(task.args))
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts < task.max_attempts:
+            mine.update(status=Task.QUEUED, last_error=error,
+                        run_after=timezone.now() + timedelta(
+                            seconds=backoff(task.attempts)))
+        else:
+            mine.update(status=Task.FAILED, last_error=error,
+                        finished=timezone.now())
+        return False
+    mine.update(status=Task.DONE, finished=timezone.now())
+    return True
+
+
+def run_pending(worker=None, lease=LEASE, limit=None):
+    """Выполняет задачи, пока они есть; возвращает число выполненных."""
+    worker = worker or worker_id()
+    count = 0
+    while limit is None or count < limit:
+        task = claim(worker, lease)
+        if task is None:
+            break
+        run(task)
+        count += 1
+    return count
+
+
+def stats():
+    """Глубина очереди по статусам и возраст самой старой ждущей задачи."""
+    counts = dict(Task.objects.order_by().values_list('status').annotate(
+        Count('id')))
+    oldest = Task.objects.filter(status=Task.QUEUED).aggregate(
+        oldest=Min('created'))['oldest']
+    return {
+        'counts': {status: counts.get(status, 0)
+                   for status, _ in Task.STATUSES},
+        'due': due(timezone.now()).count(),
+        'oldest_queued_age': (timezone.now() - oldest).total_seconds()
+        if oldest else None,
+    }
+
+
+def prune(days):
+    """Удаляет выполненные задачи старше days дней."""
+    return Task.objects.filter(
+        status=Task.DONE,
+        finished__lt=timezone.now() - timedelta(days=days),
+    ).delete()[0]
@@ -0,0 +1,102 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from . import queue
+from .models import Task
+
+CALLS = []
+
+
+def record(*args):
+    CALLS.append(args)
+
+
+def explode():
+    raise RuntimeError('сломалось')
+
+
+class QueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_and_run(self):
+        """Задача выполняется с аргументами и помечается выполненной"""
+        task = queue.enqueue(record, 1, 'два')
+        self.assertEqual(task.name, 'tasks.tests.record')
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(CALLS, [(1, 'два')])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.DONE)
+        self.assertEqual(task.attempts, 1)
+
+    def test_enqueue_requires_importable_function(self):
+        """В очередь нельзя поставить функцию без пути импорта"""
+        with self.assertRaises(ValueError):
+            queue.enqueue(lambda: None)
+
+    def test_delayed_task_waits(self):
+        """Отложенная задача не выполняется раньше срока"""
+        queue.enqueue(record, delay=60)
+        self.assertEqual(queue.run_pending(), 0)
+
+    def test_failed_task_retried_with_backoff(self):
+        """Упавшая задача повторяется с задержкой, пока есть попытки"""
+        task = queue.enqueue(explode, max_attempts=2)
+        queue.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.QUEUED)
+        self.assertIn('сломалось', task.last_error)
+        self.assertGreater(task.run_after, timezone.now())
+        Task.objects.update(run_after=timezone.now())
+        queue.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 2)
+
+    def test_claim_is_exclusive_and_lease_expires(self):
+        """Задачу получает один обработчик, пока не истечёт аренда"""
+        task = queue.enqueue(record, 1)
+        self.assertEqual(queue.claim('first').pk, task.pk)
+        self.assertIsNone(queue.claim('second'))
+        Task.objects.update(locked_until=timezone.now() - timedelta(1))
+        reclaimed = queue.claim('second')
+        self.assertEqual(reclaimed.attempts, 2)
+        # Опоздавший обработчик не перезаписывает итог нового.
+        stale = Task.objects.get(pk=task.pk)
+        stale.locked_by = 'first'
+        queue.run(stale)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.RUNNING)
+        queue.run(reclaimed)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.DONE)
+
+    def test_expired_lease_spends_attempts(self):
+        """Задача, чья аренда истекала на каждой попытке, не повторяется"""
+        task = queue.enqueue(record, max_attempts=2)
+        for worker in ('first', 'second'):
+            self.assertEqual(queue.claim(worker).pk, task.pk)
+            Task.objects.update(locked_until=timezone.now() - timedelta(1))
+        self.assertIsNone(queue.claim('third'))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertIn('Аренда истекла', task.last_error)
+
+    def test_commands(self):
+        """run_tasks --burst выполняет очередь, task_status её показывает"""
+        queue.enqueue(record, 1)
+        queue.enqueue(explode, max_attempts=1)
+        with mock.patch('django.db.connections.close_all'):
+            call_command('run_tasks', burst=True)
+        self.assertEqual(CALLS, [(1,)])
+        out = StringIO()
+        call_command('task_status', stdout=out)
+        self.assertIn('Выполнена', out.getvalue())
+        self.assertIn('tasks.tests.explode: RuntimeError: сломалось',
+                      out.getvalue())
@@ -0,0 +1,36 @@
+import signal
+import time
+
+import django
+
+# Модуль импортируется в процессе, запущенном через spawn, ещё до
+# django.setup(), поэтому модели и очередь импортируются внутри функций.
+LEASE = 60
+
+
+def work(lease=LEASE, poll=1.0, burst=False):
+    """
+    Цикл обработчика: задачи выполняются по одной, между ними проверяется
+    SIGTERM, так что остановка не обрывает задачу на середине.
+    """
+    from django.db import connections
+
+    from .queue import run_pending, worker_id
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    worker = worker_id()
+    try:
+        while not stopping:
+            if not run_pending(worker, lease, limit=1):
+                if burst:
+                    break
+                time.sleep(poll)
+    finally:
+        connections.close_all()
+
+
+def process_main(lease, poll, burst):
+    """Точка входа процесса, запущенного через spawn."""
+    django.setup()
+    work(lease, poll, burst)
@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'tasks.apps.TasksConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -30,6 +31,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
+    'core.middleware.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,13 +62,31 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Бэкенд core.db.sqlite3 включает WAL и настраивает прагмы соединения;
+# соединения переиспользуются между запросами.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# Реплики только для чтения: пути к копиям базы через запятую в переменной
+# окружения DB_REPLICAS. В тестах реплики совпадают с основной базой.
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+        filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'core.db.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -98,7 +119,10 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма только ставятся в очередь; обработчики задач отправляют их
+# пачками через EMAIL_DELIVERY_BACKEND.
+EMAIL_BACKEND = 'core.mail.QueuedEmailBackend'
+EMAIL_DELIVERY_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
@@ -106,8 +130,45 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки всегда пишутся во временный файл, а не читаются в память.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+THUMBNAIL_ENGINE = 'posts.thumbnail_engine.Engine'
+
+# Кэш общий для веб-процессов и обработчиков задач (run_tasks): миниатюры,
+# варианты картинок и команды данных сдвигают версии лент и сбрасывают
+# страницы из других процессов. Версии данных и теги страниц лежат
+# в отдельном кэше, который не вытесняет записи: вытесненная версия
+# сбросила бы все построенные на ней фрагменты, страницы и счётчики.
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION',
+                                os.path.join(BASE_DIR, 'cache'))
 CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_LOCATION, 'data'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_LOCATION, 'versions'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10 ** 9},
+    },
+}
+
+# Тесты работают с кэшем в памяти процесса: так прогоны не видят
+# страниц и версий друг друга и запущенного сервера.
+TEST_RUNNER = 'core.testing.TestRunner'
+TEST_CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'LOCATION': 'default',
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'versions',
+        'TIMEOUT': None,
+    },
 }